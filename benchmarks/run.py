@@ -0,0 +1,110 @@
+"""Runs asv style benchmark suites and stores results as JSON, compares results of two runs.
+
+    python -m benchmarks.run --quick --output results.json
+    python -m benchmarks.run --compare old.json new.json
+"""
+import argparse
+import contextlib
+import inspect
+import io
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from . import tabular
+
+modules = [tabular]
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_suites(pattern: str = None) -> list:
+    suites = []
+    for module in modules:
+        for name, suite in inspect.getmembers(module, inspect.isclass):
+            if name.endswith('Suite') and suite.__module__ == module.__name__:
+                if pattern is None or pattern in name:
+                    suites.append(suite)
+    return suites
+
+
+def run_suite(suite, repeat: int = 3, quick: bool = False) -> list:
+    params = [values[:1] for values in suite.params] if quick else suite.params
+    methods = [name for name in dir(suite) if name.startswith('time_')]
+    results = []
+    for values in itertools.product(*params):
+        instance = suite()
+        # Nodes report their progress with print, it is muted during benchmarks.
+        with contextlib.redirect_stdout(io.StringIO()):
+            instance.setup(*values)
+        for method in methods:
+            timings = []
+            for _ in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    getattr(instance, method)(*values)
+                    timings.append(time.perf_counter() - start)
+            result = {'benchmark': f'{suite.__name__}.{method}',
+                      'params': dict(zip(suite.param_names, values)),
+                      'min': min(timings), 'median': statistics.median(timings), 'repeat': repeat}
+            print(f"{result['benchmark']} {result['params']}: {result['min']:.4f} s")
+            results.append(result)
+    return results
+
+
+def run(output: str = None, pattern: str = None, repeat: int = 3, quick: bool = False) -> dict:
+    results = []
+    for suite in get_suites(pattern):
+        results.extend(run_suite(suite, repeat, quick))
+    report = {'commit': get_commit(),
+              'date': datetime.now(timezone.utc).isoformat(),
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'results': results}
+    if output is not None:
+        with open(output, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+    return report
+
+
+def compare(old: dict, new: dict, threshold: float = 1.2) -> list:
+    """Benchmarks which became slower more than threshold times, ratio of min timings is compared."""
+    def key(result):
+        return result['benchmark'], json.dumps(result['params'], sort_keys=True)
+
+    baseline = {key(result): result['min'] for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        if key(result) in baseline:
+            ratio = result['min'] / baseline[key(result)]
+            print(f"{result['benchmark']} {result['params']}: {ratio:.2f}x")
+            if ratio > threshold:
+                regressions.append({**result, 'ratio': ratio})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Potok benchmarks.')
+    parser.add_argument('--output', default=None, help='JSON file to store results.')
+    parser.add_argument('--bench', default=None, help='Run only suites which names contain this string.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help='Run only the smallest params of every suite.')
+    parser.add_argument('--compare', nargs=2, default=None, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            regressions = compare(json.load(old_file), json.load(new_file), args.threshold)
+        print(f'Regressions: {len(regressions)}')
+        raise SystemExit(int(bool(regressions)))
+    run(args.output, args.bench, args.repeat, args.quick)
@@ -0,0 +1,164 @@
+"""Benchmarks of tabular nodes in asv style: suites with params, setup and time_* methods.
+Run them with `python -m benchmarks.run` or with asv."""
+from potok.core import DataDict, Pipeline
+from potok.tabular import TabularData, Folder, LightGBM, LinReg, SyntheticData, InferencePlan
+from potok.tabular.Operators import CreateFeatureSpace
+from potok.methods import Validation, Bagging
+
+
+def make_data(n_rows: int, n_features: int = 1, problem: str = 'regression'):
+    gene = SyntheticData(problem=problem, seed=2424)
+    train = gene.create_wide(n_rows, n_features, train=True)
+    test = gene.create_wide(max(n_rows // 10, 1), n_features, train=False)
+    data = DataDict(train=train, test=test)
+    return data.X, data.Y
+
+
+def make_folds(x: DataDict, y: DataDict, n_folds: int):
+    validation = Validation(Folder(n_folds=n_folds, seed=2424))
+    x2, y2 = validation.fit(x, y)
+    return x2['Fold_1'], y2['Fold_1']
+
+
+class FolderSuite:
+    params = ([100000, 1000000, 5000000], [3, 10])
+    param_names = ['n_rows', 'n_folds']
+
+    def setup(self, n_rows, n_folds):
+        self.x, self.y = make_data(n_rows)
+        self.folder = Folder(n_folds=n_folds, seed=2424)
+        self.folder._fit_(self.x, self.y)
+
+    def time_generate_folds(self, n_rows, n_folds):
+        self.folder.generate_folds(self.x, self.y)
+
+    def time_get_folds(self, n_rows, n_folds):
+        self.folder.get_folds(self.x)
+
+
+class PanelFolderSuite:
+    params = ([1000, 10000], [100, 500], [3, 10])
+    param_names = ['n_ids', 'n_dates', 'n_folds']
+
+    def setup(self, n_ids, n_dates, n_folds):
+        gene = SyntheticData(seed=2424)
+        data = DataDict(train=gene.create_panel(n_ids, n_dates))
+        self.x, self.y = data.X, data.Y
+        self.folder = Folder(n_folds=n_folds, index_name='id', seed=2424)
+
+    def time_generate_folds_by_index(self, n_ids, n_dates, n_folds):
+        self.folder.generate_folds_by_index(self.x, self.y)
+
+
+class ValidationSuite:
+    params = ([100000, 1000000], [3, 10])
+    param_names = ['n_rows', 'n_folds']
+
+    def setup(self, n_rows, n_folds):
+        self.x, self.y = make_data(n_rows)
+        self.validation = Validation(Folder(n_folds=n_folds, seed=2424))
+        self.validation.fit(self.x, self.y)
+        self.y_frwd = self.validation.predict_forward(self.y)
+
+    def time_fit(self, n_rows, n_folds):
+        self.validation.fit(self.x, self.y)
+
+    def time_predict_backward(self, n_rows, n_folds):
+        self.validation.predict_backward(self.y_frwd)
+
+
+class BaggingSuite:
+    params = ([100000, 1000000], [5, 20])
+    param_names = ['n_rows', 'n_iter']
+
+    def setup(self, n_rows, n_iter):
+        self.x, self.y = make_data(n_rows)
+        self.bagging = Bagging(n_iter)
+        self.bagging.fit(self.x, self.y)
+        self.y_frwd = self.bagging.predict_forward(self.y)
+
+    def time_fit(self, n_rows, n_iter):
+        self.bagging.fit(self.x, self.y)
+
+    def time_predict_backward(self, n_rows, n_iter):
+        self.bagging.predict_backward(self.y_frwd)
+
+
+class LinRegSuite:
+    params = ([100000, 1000000], [10, 100])
+    param_names = ['n_rows', 'n_features']
+
+    def setup(self, n_rows, n_features):
+        self.x, self.y = make_data(n_rows, n_features)
+        self.model = LinReg(target=['Target'])
+        self.model.fit(self.x, self.y)
+
+    def time_fit(self, n_rows, n_features):
+        self.model.fit(self.x, self.y)
+
+    def time_predict(self, n_rows, n_features):
+        self.model.predict_forward(self.x)
+
+
+class LightGBMSuite:
+    params = ([100000, 1000000], [10, 100])
+    param_names = ['n_rows', 'n_features']
+
+    def setup(self, n_rows, n_features):
+        x, y = make_data(n_rows, n_features)
+        self.x, self.y = make_folds(x, y, n_folds=3)
+        self.model = LightGBM(target=['Target'])
+        self.model.model_params['n_estimators'] = 100
+        self.model.fit(self.x, self.y)
+
+    def time_fit(self, n_rows, n_features):
+        self.model.fit(self.x, self.y)
+
+    def time_predict(self, n_rows, n_features):
+        self.model.predict_forward(self.x)
+
+
+class CreateFeatureSpaceSuite:
+    params = ([1000, 10000], [100, 500], [1, 5])
+    param_names = ['n_ids', 'n_dates', 'n_features']
+
+    def setup(self, n_ids, n_dates, n_features):
+        gene = SyntheticData(seed=2424)
+        data = DataDict(train=gene.create_panel(n_ids, n_dates, n_features))
+        self.x = data.X
+        features = [f'X_{i}' for i in range(n_features)]
+        self.operator = CreateFeatureSpace(features, lag_params=[1, 7], window_params=[7], diffs_params=[1])
+
+    def time_x_forward(self, n_ids, n_dates, n_features):
+        self.operator.x_forward(self.x)
+
+
+class CombineSuite:
+    params = ([100000, 1000000], [1, 10], [5, 20])
+    param_names = ['n_rows', 'n_columns', 'n_datas']
+
+    def setup(self, n_rows, n_columns, n_datas):
+        gene = SyntheticData(seed=2424)
+        data = gene.create_wide(n_rows, n_columns)
+        self.datas = [data.copy(data=data.data.sample(frac=1.0, random_state=i)) for i in range(n_datas)]
+
+    def time_combine(self, n_rows, n_columns, n_datas):
+        TabularData.combine(self.datas)
+
+
+class MergedBoostersSuite:
+    params = ([1, 10000], [False, True])
+    param_names = ['n_rows', 'merge']
+
+    def setup(self, n_rows, merge):
+        x, y = make_data(20000, n_features=10)
+        x, y = DataDict(data_1=x), DataDict(data_1=y)
+        algo = LightGBM(target=['Target'])
+        algo.model_params['n_estimators'] = 100
+        self.pipeline = Pipeline(Bagging(5), Validation(Folder(n_folds=3, seed=2424)), algo, shapes=[1, 5, 15])
+        self.pipeline.fit(x, y)
+        self.plan = InferencePlan(self.pipeline, merge=merge)
+        self.rows = x['data_1']['test'].data[self.plan.features].to_numpy()[:n_rows]
+
+    def time_predict(self, n_rows, merge):
+        self.plan.predict(self.rows)
@@ -1,5 +1,21 @@
-from .core import Data, DataDict, ApplyToDataDict, Node, Operator, Pipeline, Layer
-from .tabular import TabularData, Folder, FolderByTime, LightGBM, LinReg, Dkl, SyntheticData, TransformY, CreateFeatureSpace
-from .vision import Augmentation, Batcher, BatchTrainer, EpochTrainer, Folder, ImageData, TorchNNModel
-from .methods import  Validation, Bagging
+import importlib
 
+from .core import Data, DataDict, LazyDataDict, ApplyToDataDict, Node, Operator, Pipeline, Layer
+
+# Other subpackages import pandas, sklearn and torch, so their names are imported on first access.
+_lazy_names_ = {
+    'tabular': ['TabularData', 'Folder', 'FolderByTime', 'LightGBM', 'LinReg', 'Dkl', 'SyntheticData',
+                'TransformY', 'CreateFeatureSpace'],
+    'vision': ['Augmentation', 'Batcher', 'BatchTrainer', 'EpochTrainer', 'ImageData', 'TorchNNModel'],
+    'methods': ['Validation', 'Bagging'],
+}
+_lazy_ = {name: package for package, names in _lazy_names_.items() for name in names}
+
+
+def __getattr__(name):
+    if name in _lazy_:
+        module = importlib.import_module('.' + _lazy_[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,38 +1,98 @@
+import contextvars
+import copy
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+
 import wrapt
-import ray
 
-from .Data import DataDict
+from .Data import DataDict, LazyDataDict, Thunk
+from .Node import Node
+from .ThreadBudget import ThreadBudget, limit_threads
+from .Tracer import Tracer
+
+
+def _apply_unwrapped_(owner_name, func_name, instance, unit, traced, arg, kwarg):
+    """Runs the undecorated function inside a worker process, returns result with its trace spans.
+    Decorated functions can not be pickled by reference, so they are resolved by name."""
+    owner = type(instance) if instance is not None else sys.modules[owner_name]
+    func = getattr(owner, func_name).__wrapped__
+    if instance is not None:
+        func = func.__get__(instance)
+    with ApplyToDataDict.use_backend('map', lazy=False), limit_threads(getattr(instance, 'n_threads', None)):
+        return Tracer.call_remote(traced, func, func.__qualname__, 'unit', unit, *arg, **kwarg)
 
 
 class ApplyToDataDict:
-    def __init__(self, mode='all', backend='map'):
+    backends = ('map', 'thread', 'process', 'ray')
+    # Default backend, number of workers and laziness, they are set per context, so pipelines running at the same
+    # time in other threads or tasks do not change them. Lazy results are LazyDataDict of thunks, units are
+    # computed on access with map backend.
+    defaults = contextvars.ContextVar('ApplyToDataDict.defaults', default=('map', None, False))
+
+    def __init__(self, mode='all', backend=None, n_workers=None):
         # self.wrapped = wrapped
         self.mode = mode
         self.backend = backend
-      
+        self.n_workers = n_workers
+
     @wrapt.decorator
     def __call__(self, wrapped, instance, args, kwargs):
         return self.apply(wrapped, instance, *args, **kwargs)
-      
+
     # def __call__(self, *args, **kwargs):
     #     return self.apply(self.wrapped, self.wrapped.__self__, *args, **kwargs)
-    
+
+    @classmethod
+    @contextmanager
+    def use_backend(cls, backend=None, n_workers=None, lazy=None):
+        """Sets backend for all decorators which do not specify it explicitly, e.g. per Pipeline, in current context."""
+        default_backend, default_n_workers, default_lazy = cls.defaults.get()
+        if backend is not None:
+            assert backend in cls.backends, f'Unknown backend = {backend}.'
+            default_backend = backend
+        if n_workers is not None:
+            default_n_workers = n_workers
+        if lazy is not None:
+            default_lazy = lazy
+        token = cls.defaults.set((default_backend, default_n_workers, default_lazy))
+        try:
+            yield
+        finally:
+            cls.defaults.reset(token)
+
     def apply(self, wrapped, instance, *args, **kwargs):
-        units_list = [arg.keys() for arg in args]
-        units = sorted(set.intersection(*map(set, units_list)), key=units_list[0].index)
+        units = DataDict.common_units(args)
 
         if ('train' in units) and (self.mode != 'all'):
             units.remove('train')
 
+        default_backend, default_n_workers, default_lazy = self.defaults.get()
+        # Laziness is propagated, results of lazy inputs are lazy.
+        if default_lazy or any(isinstance(arg, LazyDataDict) for arg in (*args, *kwargs.values())):
+            return self.apply_lazy(wrapped, instance, units, args, kwargs)
+
         args2 = [[arg[unit] for arg in args] for unit in units]
         kwargs2 = {unit: {k: v[unit] for k, v in kwargs.items()} for unit in units}
 
-        if self.backend == 'ray':
+        backend = self.backend if self.backend is not None else default_backend
+        n_workers = self.n_workers if self.n_workers is not None else default_n_workers
+        if len(units) < 2 and backend != 'ray':
+            backend = 'map'
+        if backend in ('thread', 'process'):
+            wrapped, instance = self._split_threads_(wrapped, instance, min(n_workers or os.cpu_count(), len(units)))
+
+        if backend == 'ray':
             res = self.apply_with_ray(wrapped, instance, *args2, **kwargs2)
-        elif self.backend == 'map':
+        elif backend == 'map':
             res = self.apply_with_map(wrapped, instance, *args2, **kwargs2)
+        elif backend == 'thread':
+            res = self.apply_with_threads(wrapped, instance, n_workers, *args2, **kwargs2)
+        elif backend == 'process':
+            res = self.apply_with_processes(wrapped, instance, n_workers, *args2, **kwargs2)
         else:
-            raise Exception()
+            raise Exception(f'Unknown backend = {backend}.')
 
         # if isinstance(res[0], tuple):
         #     raise Exception('Probably fit method was wrapped, it is forbidden.')
@@ -41,15 +101,73 @@ class ApplyToDataDict:
             #     arg = [var[i] for var in res]
             #     result.append(DataDict(**dict(zip(units, arg))))
             # result = tuple(result)
-        result = DataDict(**dict(zip(units, res)))
+        result = DataDict(dict(zip(units, res)))
         return result
 
+    @staticmethod
+    def _split_threads_(wrapped, instance, n_concurrent: int):
+        """Threads of node are split between units running at the same time, units run on a copy of node
+        holding the share. Nodes without threads budget split all cores, as Layer does."""
+        if n_concurrent < 2 or not isinstance(instance, Node) or not hasattr(wrapped, '__func__'):
+            return wrapped, instance
+        node = copy.copy(instance)
+        node.n_threads = min(ThreadBudget(instance.n_threads).split(n_concurrent))
+        return wrapped.__func__.__get__(node), node
+
+    @staticmethod
+    def _snapshot_(node):
+        """Shallow copy of node and of its nested nodes. Fit rebinds fitted attributes, e.g. model, so refitting node
+        does not change the snapshot. Fitted objects are shared, they are frozen: changing them in place, e.g. training
+        a torch model further, changes pending thunks. They are not deep copied, since copying a fitted model
+        costs more than a prediction, e.g. a copy of LightGBM booster serializes all trees."""
+        snapshot = copy.copy(node)
+        for key, value in node.__dict__.items():
+            if isinstance(value, Node):
+                snapshot.__dict__[key] = ApplyToDataDict._snapshot_(value)
+        return snapshot
+
+    @staticmethod
+    def apply_lazy(wrapped, instance, units: list, args: tuple, kwargs: dict) -> LazyDataDict:
+        if instance is not None and hasattr(wrapped, '__func__'):
+            # Thunks are bound to a snapshot of node, so refitting node does not change them.
+            wrapped = wrapped.__func__.__get__(ApplyToDataDict._snapshot_(instance))
+        name = wrapped.__qualname__
+        res = {unit: Thunk(Tracer.call, wrapped, name, 'unit', unit,
+                           *[Thunk(arg.__getitem__, unit) for arg in args],
+                           **{k: Thunk(v.__getitem__, unit) for k, v in kwargs.items()}) for unit in units}
+        return LazyDataDict(res)
+
     @staticmethod
     def apply_with_ray(wrapped, instance, *args, **kwargs):
+        import ray
         state = ray.put(instance)
         res = [ray.remote(wrapped.__func__).remote(state, *arg, **kwarg) for arg, kwarg in zip(args, kwargs.values())]
         return ray.get(res)
 
     @staticmethod
     def apply_with_map(wrapped, instance, *args, **kwargs):
-        return [wrapped(*arg, **kwarg) for arg, kwarg in zip(args, kwargs.values())]
+        name = wrapped.__qualname__
+        return [Tracer.call(wrapped, name, 'unit', unit, *arg, **kwarg) for arg, (unit, kwarg) in zip(args, kwargs.items())]
+
+    @staticmethod
+    def apply_with_threads(wrapped, instance, n_workers, *args, **kwargs):
+        name = wrapped.__qualname__
+        with ThreadPoolExecutor(max_workers=n_workers) as executor, limit_threads(getattr(instance, 'n_threads', None)):
+            # Workers run in a copy of the submitting context, so they see its defaults.
+            res = [executor.submit(contextvars.copy_context().run,
+                                   Tracer.call, wrapped, name, 'unit', unit, *arg, **kwarg)
+                   for arg, (unit, kwarg) in zip(args, kwargs.items())]
+            return [r.result() for r in res]
+
+    @staticmethod
+    def apply_with_processes(wrapped, instance, n_workers, *args, **kwargs):
+        # Changes of instance state made inside workers are not returned back.
+        traced = Tracer.active.get() is not None
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_apply_unwrapped_, wrapped.__module__, wrapped.__name__, instance,
+                                       unit, traced, arg, kwarg) for arg, (unit, kwarg) in zip(args, kwargs.items())]
+            res = [f.result() for f in futures]
+        if traced:
+            for _, events in res:
+                Tracer.active.get().add(events)
+        return [r for r, _ in res]
@@ -2,6 +2,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Iterator, Tuple
 import copy
+import hashlib
+import pickle
 # import ray
 
 
@@ -36,24 +38,44 @@ class Data:
     def reindex(self, index) -> Data:
         raise Exception('Not implemented')
 
+    def take(self, positions) -> Data:
+        """Rows at positions, subclasses may return a view without copying."""
+        return self.get_by_index(self.index[positions])
+
     @staticmethod
     def combine(datas: List[Data]) -> Data:
         raise Exception('Not implemented')
+
+    def fingerprint(self) -> str:
+        """Content hash of data, used as a cache key."""
+        return hashlib.sha1(pickle.dumps(self.__getstate__())).hexdigest()
+
+    def stats(self) -> dict:
+        """Number of rows and size in bytes, used by Tracer."""
+        rows = len(self) if hasattr(self, '__len__') else None
+        return {'rows': rows, 'bytes': None}
     
+    def assign(self, columns: dict) -> Data:
+        raise Exception('Not implemented')
+
     def copy(self, **kwargs) -> Data:
+        """Shallow copy, contents are shared, so they must not be written in place, use assign."""
         new_data = copy.copy(self)
         new_data.__dict__.update(kwargs)
         return new_data
 
 
 class DataDict(Data):
-    def __init__(self, **kwargs) -> None:
+    """Ordered mapping of units, units are stored right in instance __dict__.
+    Keys are strings or tuples, tuple keys are passed as mapping: DataDict({('data_1', 'Fold_1'): unit})."""
+    def __init__(self, units: dict = None, /, **kwargs) -> None:
+        if units:
+            self.__dict__.update(units)
         if kwargs:
-            types = []
-            for k, v in kwargs.items():
-                setattr(self, k, v)
-                types.append(type(v))
-            assert types.count(types[0]) == len(types), 'All unit types must be the same.'
+            self.__dict__.update(kwargs)
+        if self.__dict__:
+            types = {type(v) for v in self.__dict__.values()}
+            assert len(types) == 1, 'All unit types must be the same.'
                     
     def __repr__(self) -> str:
         prefix = self.__class__.__name__ + '(' 
@@ -63,16 +85,19 @@ class DataDict(Data):
     
     def __len__(self) -> int:
         return len(self.__dict__)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__dict__
     
     # def __iter__(self) -> Iterator:
     #     return iter(self.__dict__.items())
     
-    def __getitem__(self, key: str) -> Data:
-        return getattr(self, key, None)
+    def __getitem__(self, key) -> Data:
+        return self.__dict__.get(key)
     
-    def __setitem__(self, key: str, value: Data) -> None:
-        assert key not in list(self.__dict__.keys()), f'Key Error: {key}.'
-        self.__setstate__({key: value})
+    def __setitem__(self, key, value: Data) -> None:
+        assert key not in self.__dict__, f'Key Error: {key}.'
+        self.__dict__[key] = value
         return
 
     def __getstate__(self) -> dict:
@@ -84,52 +109,189 @@ class DataDict(Data):
         return
 
     def keys(self) -> list:
-        units = list(self.__dict__.keys())
+        units = list(self.__dict__)
         return units
 
     def values(self) -> list:
-        return list(self.__dict__.copy().values())
+        return list(self.__dict__.values())
 
     def items(self) -> Iterator:
-        return iter(self.__dict__.copy().items())
+        return self.__dict__.items()
+
+    def raw_items(self) -> Iterator:
+        """Units as they are stored, unevaluated units of LazyDataDict are thunks."""
+        return self.__dict__.items()
+
+    @staticmethod
+    def join_keys(key1, key2):
+        """Nested key, tuple keys are concatenated and string keys are joined with underscore."""
+        if isinstance(key1, tuple) or isinstance(key2, tuple):
+            key1 = key1 if isinstance(key1, tuple) else (key1,)
+            key2 = key2 if isinstance(key2, tuple) else (key2,)
+            return key1 + key2
+        return key1 + '_' + key2
+
+    @staticmethod
+    def common_units(datas: list) -> list:
+        """Units present in all datas, in order of the first one."""
+        others = [data if isinstance(data, DataDict) else set(data.keys()) for data in datas[1:]]
+        units = [unit for unit in datas[0].keys() if all(unit in other for other in others)]
+        return units
 
     @property
     def X(self) -> DataDict:
         X = {k: v.X for k, v in self.items()}
-        return DataDict(**X)
+        return DataDict(X)
 
     @property
     def Y(self) -> DataDict:
         Y = {k: v.Y for k, v in self.items()}
-        return DataDict(**Y)
+        return DataDict(Y)
 
     @property
     def index(self) -> DataDict:
         indx = {k: v.index for k, v in self.items()}
-        return DataDict(**indx)
+        return DataDict(indx)
 
     def get_by_index(self, index: DataDict) -> DataDict:
         assert self.keys() == index.keys(), 'Units must match.'
         res = {k1: v1.get_by_index(v2) for (k1, v1), (k2, v2) in zip(self.items(), index.items())}
-        return DataDict(**res)
+        return DataDict(res)
 
     def reindex(self, index: DataDict) -> DataDict:
         assert self.keys() == index.keys(), 'Units must match.'
         res = {k1: v1.reindex(v2) for (k1, v1), (k2, v2) in zip(self.items(), index.items())}
-        return DataDict(**res)
+        return DataDict(res)
+
+    def fingerprint(self) -> str:
+        key = hashlib.sha1()
+        for k, v in self.items():
+            value = v.fingerprint() if isinstance(v, Data) else hashlib.sha1(pickle.dumps(v)).hexdigest()
+            key.update((str(k) + value).encode())
+        return key.hexdigest()
+
+    def stats(self) -> dict:
+        rows, size = 0, 0
+        for v in self.values():
+            if isinstance(v, Data):
+                stats = v.stats()
+                rows += stats['rows'] or 0
+                size += stats['bytes'] or 0
+        return {'rows': rows, 'bytes': size}
 
     @staticmethod
-    def combine(data: List[DataDict]) -> DataDict:
+    def combine(data: List[DataDict], **kwargs) -> DataDict:
+        """Combines units of datas, kwargs are passed to combine of units class, e.g. method and weights."""
         # можно сделать просто как метод класса, потому что все равно комбайним поля класса
         if all([hasattr(v, 'keys') for v in data]):
-            units_list = [v.keys() for v in data]
-            units = sorted(set.intersection(*map(set, units_list)), key=units_list[0].index)
+            units = DataDict.common_units(data)
             assert len(units) >= 1, 'Units intersection is empty.'
+            if any(isinstance(v, LazyDataDict) for v in data):
+                # Units are combined on access.
+                return LazyDataDict({unit: Thunk(DataDict._combine_unit_, data, unit, kwargs) for unit in units})
             new_data = [[arg[unit] for arg in data] for unit in units]
         else:
             units = ['combined']
             new_data = data
 
         data_cls = new_data[0][0]
-        res = {unit: data_cls.combine(new_data[i]) for i, unit in enumerate(units)}
-        return DataDict(**res)
+        res = {unit: data_cls.combine(new_data[i], **kwargs) for i, unit in enumerate(units)}
+        return DataDict(res)
+
+    @staticmethod
+    def _combine_unit_(data: List[DataDict], unit, kwargs: dict) -> Data:
+        datas = [arg[unit] for arg in data]
+        return datas[0].combine(datas, **kwargs)
+
+
+class Thunk:
+    """Deferred call, thunks among arguments are evaluated before the call."""
+    __slots__ = ('func', 'args', 'kwargs')
+
+    def __init__(self, func, *args, **kwargs) -> None:
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        args = [arg() if isinstance(arg, Thunk) else arg for arg in self.args]
+        kwargs = {k: v() if isinstance(v, Thunk) else v for k, v in self.kwargs.items()}
+        return self.func(*args, **kwargs)
+
+
+class LazyDataDict(DataDict):
+    """DataDict which units may be thunks, a thunk is evaluated on first access of its unit and replaced by result.
+    Operations on unevaluated units are deferred too, so units which are never read are never computed."""
+    def __init__(self, units: dict = None, /, **kwargs) -> None:
+        # Units are not type checked, unevaluated ones are thunks.
+        if units:
+            self.__dict__.update(units)
+        if kwargs:
+            self.__dict__.update(kwargs)
+
+    def __repr__(self) -> str:
+        body = ', '.join([f'{k}=<lazy>' if isinstance(v, Thunk) else f'{k}={v!r}' for k, v in self.raw_items()])
+        return self.__class__.__name__ + '(' + body + ')'
+
+    def __getitem__(self, key) -> Data:
+        value = self.__dict__.get(key)
+        if isinstance(value, Thunk):
+            value = value()
+            self.__dict__[key] = value
+        return value
+
+    def __getstate__(self) -> dict:
+        # Thunks can not be pickled, so all units are evaluated.
+        state = {k: self[k] for k in self.keys()}
+        return state
+
+    def values(self) -> list:
+        return [self[k] for k in self.keys()]
+
+    def items(self) -> Iterator:
+        return iter([(k, self[k]) for k in self.keys()])
+
+    def evaluated(self) -> list:
+        """Keys of units which are already computed."""
+        return [k for k, v in self.raw_items() if not isinstance(v, Thunk)]
+
+    def map(self, func, *datas: DataDict) -> LazyDataDict:
+        """func(unit, *units of datas) for every unit, evaluated units are mapped at once, the rest on access."""
+        res = {}
+        for k, v in self.raw_items():
+            if isinstance(v, Thunk) or any(isinstance(data.__dict__.get(k), Thunk) for data in datas):
+                res[k] = Thunk(func, Thunk(self.__getitem__, k), *[Thunk(data.__getitem__, k) for data in datas])
+            else:
+                res[k] = func(v, *[data[k] for data in datas])
+        return LazyDataDict(res)
+
+    @property
+    def X(self) -> LazyDataDict:
+        return self.map(lambda v: v.X)
+
+    @property
+    def Y(self) -> LazyDataDict:
+        return self.map(lambda v: v.Y)
+
+    @property
+    def index(self) -> LazyDataDict:
+        return self.map(lambda v: v.index)
+
+    def get_by_index(self, index: DataDict) -> LazyDataDict:
+        assert self.keys() == index.keys(), 'Units must match.'
+        return self.map(lambda v, i: v.get_by_index(i), index)
+
+    def reindex(self, index: DataDict) -> LazyDataDict:
+        assert self.keys() == index.keys(), 'Units must match.'
+        return self.map(lambda v, i: v.reindex(i), index)
+
+    def stats(self) -> dict:
+        # Only evaluated units are measured.
+        rows, size = 0, 0
+        for k in self.evaluated():
+            v = self.__dict__[k]
+            if isinstance(v, Data):
+                stats = v.stats()
+                rows += stats['rows'] or 0
+                size += stats['bytes'] or 0
+        return {'rows': rows, 'bytes': size}
@@ -1,11 +1,28 @@
+import contextvars
+import copy
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Tuple
 
 from .Node import Node
-from .Data import Data, DataDict
+from .Data import Data, DataDict, LazyDataDict
+from .ApplyToDataDict import ApplyToDataDict
+from .ThreadBudget import ThreadBudget, limit_threads
+from .Tracer import Tracer
+
+
+def _run_node_(node: Node, method: str, key, traced: bool, *args):
+    """Runs node method inside a worker and returns fitted node state along with result and trace spans."""
+    with ApplyToDataDict.use_backend('map', lazy=False), limit_threads(node.n_threads):
+        res, events = Tracer.call_remote(traced, getattr(node, method), f'{node.name}.{method}', 'node', key, *args)
+    return node.__getstate__(), res, events
 
 
 class Layer(Node):
+    backends = ('map', 'thread', 'process', 'ray')
+
     def __init__(self, *nodes, **kwargs):
         super().__init__(**kwargs)
         layer = []
@@ -16,6 +33,15 @@ class Layer(Node):
                 raise Exception(f'Unknown node type={node.__class__.__name__}')
                 
         self.layer = layer
+        # Nodes of layer are executed in parallel with map, thread, process or ray backend.
+        self.backend = kwargs.get('backend', 'map')
+        self.n_workers = kwargs.get('n_workers', None)
+        assert self.backend in self.backends, f'Unknown backend = {self.backend}.'
+        # Cores budget of layer, it is split between nodes running at the same time.
+        self.n_threads = kwargs.get('n_threads', None)
+        self.threads = None
+        # Prints threads per node when they change.
+        self.verbose = kwargs.get('verbose', False)
 
     def __len__(self) -> int:
         return len(self.layer)
@@ -36,32 +62,101 @@ class Layer(Node):
             prefix_nd = prefix / suffix_nd
             node.load(prefix_nd)
 
+    def fingerprint(self) -> str:
+        # Execution settings of layer do not change results, so only nodes are hashed.
+        key = hashlib.sha1()
+        for node in self.layer:
+            key.update(node.fingerprint().encode())
+        return key.hexdigest()
+
+    def set_threads(self, n_threads: int) -> None:
+        self.n_threads = n_threads
+        return None
+
     def fit(self, x: DataDict, y: DataDict):
         assert len(self.layer) == len(x) == len(y), 'Layer and data shapes must be same.'
-        res = {k1: node.fit(xx, yy) for node, (k1, xx), (k2, yy) in zip(self.layer, x.items(), y.items())}
-        x2 = self._flatten_forward_(DataDict(**{k: v[0] for k, v in res.items()}))
-        y2 = self._flatten_forward_(DataDict(**{k: v[1] for k, v in res.items()}))
+        res = dict(zip(x.keys(), self._map_nodes_('fit', x.keys(), x.values(), y.values())))
+        x2 = self._flatten_forward_(DataDict({k: v[0] for k, v in res.items()}))
+        y2 = self._flatten_forward_(DataDict({k: v[1] for k, v in res.items()}))
         return x2, y2
     
     def predict_forward(self, x: DataDict):
         assert len(self.layer) == len(x), 'Layer and data shapes must be same.'
-        res = {k: node.predict_forward(xx) for node, (k, xx) in zip(self.layer, x.items())}
-        x2 = self._flatten_forward_(DataDict(**res))
+        res = dict(zip(x.keys(), self._map_nodes_('predict_forward', x.keys(), x.values())))
+        x2 = self._flatten_forward_(DataDict(res))
         return x2
     
     def predict_backward(self, y: DataDict):
         y2 = self._flatten_backward_(y)
         assert len(self.layer) == len(y2), 'Layer and data shapes must be same.'
-        res = {k: node.predict_backward(yy) for node, (k, yy) in zip(self.layer, y2.items())}
-        result = DataDict(**res)
+        res = dict(zip(y2.keys(), self._map_nodes_('predict_backward', y2.keys(), y2.values())))
+        result = DataDict(res)
         return result
 
+    def _split_threads_(self) -> int:
+        if self.backend == 'map' or len(self.layer) < 2:
+            n_concurrent = 1
+        else:
+            n_concurrent = min(self.n_workers or os.cpu_count(), len(self.layer))
+
+        if self.n_threads is None and n_concurrent == 1:
+            return n_concurrent
+
+        budget = ThreadBudget(self.n_threads)
+        threads = budget.assign(len(self.layer), n_concurrent)
+        for node, n_threads in zip(self.layer, threads):
+            node.set_threads(n_threads)
+
+        if self.verbose and threads != self.threads:
+            print(f'Thread budget of {self.name}: {budget.n_cores} cores, '
+                  f'{n_concurrent} concurrent nodes, threads per node = {threads}')
+        self.threads = threads
+        return n_concurrent
+
+    def _map_nodes_(self, method: str, keys: list, *datas: list) -> list:
+        args = list(zip(*datas))
+        n_concurrent = self._split_threads_()
+        if n_concurrent == 1:
+            return [Tracer.call(getattr(node, method), f'{node.name}.{method}', 'node', key, *arg)
+                    for node, key, arg in zip(self.layer, keys, args)]
+
+        traced = Tracer.active.get() is not None
+        if self.backend == 'thread':
+            # Nodes are shallow copies sharing mutable attributes, so they are fitted on deep copies.
+            nodes = [copy.deepcopy(node) for node in self.layer] if method == 'fit' else self.layer
+            with ThreadPoolExecutor(max_workers=n_concurrent) as executor, limit_threads(min(self.threads)):
+                # Nodes run in copies of the submitting context, so they see backend of ApplyToDataDict set by Pipeline.
+                futures = [executor.submit(contextvars.copy_context().run, Tracer.call, getattr(node, method),
+                                           f'{node.name}.{method}', 'node', key, *arg)
+                           for node, key, arg in zip(nodes, keys, args)]
+                results = [f.result() for f in futures]
+            res = [(node.__getstate__(), r, []) for node, r in zip(nodes, results)]
+        elif self.backend == 'process':
+            with ProcessPoolExecutor(max_workers=n_concurrent) as executor:
+                futures = [executor.submit(_run_node_, node, method, key, traced, *arg)
+                           for node, key, arg in zip(self.layer, keys, args)]
+                res = [f.result() for f in futures]
+        elif self.backend == 'ray':
+            import ray
+            remote = ray.remote(_run_node_)
+            res = ray.get([remote.remote(node, method, key, traced, *arg) for node, key, arg in zip(self.layer, keys, args)])
+        else:
+            raise Exception(f'Unknown backend = {self.backend}.')
+
+        for node, (state, _, events) in zip(self.layer, res):
+            node.__setstate__(state)
+            if traced:
+                Tracer.active.get().add(events)
+        return [r for _, r, _ in res]
+
     def _flatten_forward_(self, data: DataDict) -> DataDict:
         keys1 = data.keys()
         if isinstance(data[keys1[0]], DataDict):
-            keys2 = data[keys1[0]].keys()
-            if isinstance(data[keys1[0]][keys2[0]], DataDict):
-                data = DataDict(**{k1 + '_' + k2: v2 for k1, v1 in data.items() for k2, v2 in v1.items()})
+            # Stored units are checked, so lazy units are not evaluated, thunks are never nested.
+            unit = next(iter(data[keys1[0]].raw_items()))[1]
+            if isinstance(unit, DataDict):
+                cls = LazyDataDict if any(isinstance(v1, LazyDataDict) for v1 in data.values()) else DataDict
+                data = cls({DataDict.join_keys(k1, k2): v2 for k1, v1 in data.items() for k2, v2 in v1.raw_items()})
         return data
 
     def _flatten_backward_(self, data: DataDict) -> DataDict:
@@ -69,14 +164,21 @@ class Layer(Node):
             grouper = int(round(len(data) / len(self.layer)))
             assert grouper > 1, 'Something super wrong.'
             n_iter = int(round(len(data) / grouper))
+            items = list(data.raw_items())
             shaped = DataDict()
             for i in range(n_iter):
-                subkeys = data.keys()[i * grouper: (i + 1) * grouper]
-                subdict = {k: v for k, v in data.items() if k in subkeys}
-                shaped[f'data_{i + 1}'] = DataDict(**subdict)
+                subdict = dict(items[i * grouper: (i + 1) * grouper])
+                shaped[self._parent_key_(items[i * grouper][0], i)] = data.__class__(subdict)
             return shaped
         return data
 
+    @staticmethod
+    def _parent_key_(key, i: int):
+        # Tuple keys keep the nesting, so the key of the previous layer is restored.
+        if isinstance(key, tuple) and len(key) > 1:
+            return key[:-1] if len(key) > 2 else key[0]
+        return f'data_{i + 1}'
+
     # @staticmethod
     # def _flatten_forward_(data: DataDict) -> DataDict:
     #     units1 = data.keys
@@ -90,79 +192,3 @@ class Layer(Node):
     #     if len(data) != len(self.layer):
     #         data = DataDict(data_1=data)
     #     return data
-
-
-# class Layer(Node):
-#     def __init__(self, *nodes, **kwargs):
-#         super().__init__(**kwargs)
-#         layer = []
-#         for node in nodes:
-#             if isinstance(node, Node):
-#                 layer.append(node.copy)
-#             else:
-#                 raise Exception(f'Unknown node type={node.__class__.__name__}')
-                
-#         self.layer = layer
-#         self.shapes = None
-
-#     def fit(self, x, y):
-#         assert len(self.layer) == len(x) == len(y), 'Layer and data shapes must be same.'
-
-#         actors = [ray.remote(node.__class__).remote(**node.__dict__) for node in self.layer]
-#         res = [node.fit.remote(xx, yy) for node, xx, yy in zip(actors, x, y)]
-
-#         states = ray.get([node.__getstate__.remote() for node in actors])
-#         [node.__setstate__(state) for node, state in zip(self.layer, states)]
-        
-#         res = ray.get(res)
-
-#         x2 = DataLayer(*self._flatten_forward_(list(map(lambda x: x[0], res))))
-#         y2 = DataLayer(*self._flatten_forward_(list(map(lambda x: x[1], res))))
-#         return x2, y2
-    
-#     def predict_forward(self, x):
-#         assert len(self.layer) == len(x), 'Layer and data shapes must be same.'        
-#         res = [ray.remote(node.predict_forward.__func__).remote(node, xx) for node, xx in zip(self.layer, x)]
-#         result = ray.get(res)
-#         result1d = DataLayer(*self._flatten_forward_(result))
-#         return result1d
-    
-#     def predict_backward(self, y):
-#         y2 = self._flatten_backward_(y)
-#         assert len(self.layer) == len(y2), 'Layer and data shapes must be same.'
-#         res = [ray.remote(node.predict_backward.__func__).remote(node, yy) for node, yy in zip(self.layer, y2)]
-#         result = DataLayer(*ray.get(res))
-#         return result
-    
-#     def _flatten_forward_(self, irr_list):
-#         flat = []
-#         shapes = []
-#         for i in irr_list:
-#             if isinstance(i, (DataLayer, list)):
-#                 flat.extend(i)
-#                 shapes.append(len(i))
-#             elif isinstance(i, (DataUnit, Data)):
-#                 flat.append(i)
-#                 shapes.append(0)
-#             else:
-#                 raise Exception(f'Unknown type of data={i.__class__.__name__}')
-#         self.shapes = shapes
-#         return flat
-    
-#     def _flatten_backward_(self, list1d):
-#         if isinstance(list1d, DataLayer):
-#             list1d = list1d.to_list()
-#         start = 0
-#         end = 0
-#         irr_list = []
-#         for d in self.shapes:
-#             if d == 0:
-#                 sl = list1d[start]
-#                 start += 1
-#                 irr_list.append(sl)
-#             else:
-#                 end = start + d
-#                 sl = DataLayer(*list1d[start:end])
-#                 start = end
-#                 irr_list.append(sl)
-#         return irr_list
\ No newline at end of file
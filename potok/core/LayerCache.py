@@ -0,0 +1,84 @@
+import dill
+import hashlib
+import os
+from pathlib import Path
+from typing import Tuple
+
+from .Data import DataDict
+from .Layer import Layer
+from .Node import dump_by_ref
+
+
+class LayerCache:
+    """On-disk cache of fitted layers keyed by fingerprints of layer config and input data.
+    Least recently used entries are evicted when cache exceeds max_size bytes or max_entries."""
+    suffix = '.dill'
+
+    def __init__(self, path: str, max_size: int = None, max_entries: int = None):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.max_entries = max_entries
+        # Layers loaded instead of fitted by this cache.
+        self.hits = 0
+
+    @staticmethod
+    def make_key(layer: Layer, x_fingerprint: str, y_fingerprint: str) -> str:
+        key = hashlib.sha1()
+        for fingerprint in (layer.fingerprint(), x_fingerprint, y_fingerprint):
+            key.update(fingerprint.encode())
+        return key.hexdigest()
+
+    def fit(self, layer: Layer, x: DataDict, y: DataDict, fingerprints: Tuple[str, str] = None):
+        """Fits layer or loads its fitted state and outputs, returns outputs with their fingerprints."""
+        if fingerprints is None:
+            fingerprints = x.fingerprint(), y.fingerprint()
+        key = self.make_key(layer, *fingerprints)
+
+        entry = self.load(key)
+        if entry is not None:
+            state, x2, y2, fingerprints2 = entry
+            layer.__setstate__(state)
+            self.hits += 1
+            print(f'Loaded {layer.name} from cache {key}')
+            return x2, y2, fingerprints2
+
+        x2, y2 = layer.fit(x, y)
+        fingerprints2 = x2.fingerprint(), y2.fingerprint()
+        self.dump(key, (layer.__getstate__(), x2, y2, fingerprints2))
+        return x2, y2, fingerprints2
+
+    def load(self, key: str):
+        file_name = self.path / (key + self.suffix)
+        if not file_name.exists():
+            return None
+        with open(file_name, 'rb') as dill_file:
+            entry = dill.load(dill_file)
+        # Touch to mark entry as recently used.
+        os.utime(file_name)
+        return entry
+
+    def dump(self, key: str, entry: tuple) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        file_name = self.path / (key + self.suffix)
+        tmp_name = self.path / (key + '.tmp')
+        with open(tmp_name, 'wb') as dill_file:
+            dump_by_ref(entry, dill_file)
+        os.replace(tmp_name, file_name)
+        self.evict()
+        return None
+
+    def evict(self) -> None:
+        files = sorted(self.path.glob('*' + self.suffix), key=lambda f: f.stat().st_mtime, reverse=True)
+        size = 0
+        for i, file_name in enumerate(files):
+            size += file_name.stat().st_size
+            too_many = self.max_entries is not None and i >= self.max_entries
+            too_big = self.max_size is not None and size > self.max_size and i > 0
+            if too_many or too_big:
+                file_name.unlink()
+        return None
+
+    def clear(self) -> None:
+        for file_name in self.path.glob('*' + self.suffix):
+            file_name.unlink()
+        return None
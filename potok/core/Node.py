@@ -1,12 +1,23 @@
 from __future__ import annotations
 import copy
 import dill
+import hashlib
+import warnings
 from pathlib import Path
 from typing import List,  Tuple
 
 from .Data import Data, DataDict
 
 
+def dump_by_ref(obj, file) -> None:
+    """Pickles obj with dill, classes are pickled by reference. dill can not locate potok classes, since their
+    modules are named as classes and are shadowed by them in packages, so the warning is silenced for them only."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message=r"Cannot locate reference to <class 'potok\.",
+                                category=dill.PicklingWarning)
+        dill.dump(obj, file, byref=True)
+
+
 class Serializable:
     def __init__(self, **kwargs):
         if bool(kwargs) and ('name' in kwargs):
@@ -30,7 +41,7 @@ class Serializable:
         self._restate_()
         file_name = prefix / (self.name + '.dill')
         with open(file_name, "wb") as dill_file:
-            dill.dump(self, dill_file)
+            dump_by_ref(self, dill_file)
 
     def load(self, prefix: Path = None) -> None:
         file_name = prefix / (self.name + '.dill')
@@ -58,6 +69,23 @@ class Serializable:
 
 
 class Node(Serializable):
+    # Number of threads for model inside node, None means library default.
+    n_threads = None
+    # Attributes set by fit, they are not a part of node configuration.
+    fitted_attributes = ()
+    # Execution settings, they do not change results, so they are not a part of node configuration either.
+    execution_attributes = ('n_threads',)
+
+    def set_threads(self, n_threads: int) -> None:
+        self.n_threads = n_threads
+        for key, value in list(self.__dict__.items()):
+            if isinstance(value, Node) and value.n_threads != n_threads:
+                # Nested nodes may be shared with nodes of user, so threads are set on their copies.
+                value = value.copy
+                value.set_threads(n_threads)
+                self.__dict__[key] = value
+        return None
+
     def fit(self, x: Data, y: Data) -> Tuple[Data, Data]:
         return x, y
 
@@ -71,6 +99,19 @@ class Node(Serializable):
     def copy(self) -> Node:
         return copy.copy(self)
 
+    def config(self) -> dict:
+        """Unfitted configuration of node, nested nodes are given by their fingerprints."""
+        state = self.__getstate__()
+        excluded = set(self.fitted_attributes) | set(self.execution_attributes)
+        config = {k: (v.fingerprint() if isinstance(v, Node) else v) for k, v in state.items() if k not in excluded}
+        return config
+
+    def fingerprint(self) -> str:
+        """Hash of node class and configuration, used as a cache key, fitted state is not hashed."""
+        key = hashlib.sha1(self.__class__.__qualname__.encode())
+        key.update(dill.dumps(self.config()))
+        return key.hexdigest()
+
     def __str__(self) -> str:
         return self.name
 
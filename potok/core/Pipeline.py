@@ -2,17 +2,20 @@
 from .Data import Data, DataDict
 from .Node import Node, Operator
 from .Layer import Layer
+from .ApplyToDataDict import ApplyToDataDict
+from .Tracer import Tracer
 
-import gc
 from pathlib import Path
 from time import gmtime, strftime
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterable, Iterator
 
 
 class Pipeline(Node):
     """Pipeline works with DataLayer and Layer"""
     def __init__(self, *nodes: List[Node], **kwargs: dict):
         super().__init__(**kwargs)
+        if len(nodes) == 1 and isinstance(nodes[0], (list, tuple)):
+            nodes = nodes[0]
         _nodes_ = []
         for node in nodes:
             if isinstance(node, (Node, Operator)):
@@ -27,6 +30,22 @@ class Pipeline(Node):
         # Todo: решить проблему с шейпами, хорошо бы их генерировать автоматом
         self.shapes = kwargs['shapes']
         assert len(self.shapes) == len(self.nodes), 'Data and nodes shapes do not match.'
+        # Backend of ApplyToDataDict for all nodes of pipeline: map, thread, process or ray.
+        self.backend = kwargs.get('backend', None)
+        self.n_workers = kwargs.get('n_workers', None)
+        # Lazy units are computed on first access, so units which are never read are never computed.
+        self.lazy = kwargs.get('lazy', None)
+        # Backend of Layer to execute nodes of the same layer in parallel.
+        self.layer_backend = kwargs.get('layer_backend', 'map')
+        self.layer_n_workers = kwargs.get('layer_n_workers', None)
+        # Cores budget of pipeline, it is split between nodes running at the same time.
+        self.n_threads = kwargs.get('n_threads', None)
+        # Layers print threads per node when they change.
+        self.verbose = kwargs.get('verbose', False)
+        # Optional LayerCache to load fitted layers with unchanged inputs and config.
+        self.cache = kwargs.get('cache', None)
+        # Optional Tracer to record spans of layers, nodes and units calls.
+        self.tracer = kwargs.get('tracer', None)
 
         # self.current_fit = 0
         # self.current_predict = 0
@@ -34,10 +53,25 @@ class Pipeline(Node):
     def _compile_(self) -> None:
         layers = []
         for node, num in zip(self.nodes, self.shapes):
-            layer = Layer(*[node.copy for _ in range(num)])
+            layer = Layer(*[node.copy for _ in range(num)],
+                          backend=self.layer_backend, n_workers=self.layer_n_workers, n_threads=self.n_threads,
+                          verbose=self.verbose)
             layers.append(layer)
         self.layers = layers
         return None
+
+    def set_threads(self, n_threads: int) -> None:
+        self.n_threads = n_threads
+        for layer in self.layers or []:
+            layer.set_threads(n_threads)
+        return None
+
+    def threads_report(self) -> Dict[str, list]:
+        """Threads given to every node of every layer during the last run."""
+        if self.layers is None:
+            raise Exception('Fit your model before.')
+        report = {layer.name + '_' + str(i): layer.threads for i, layer in enumerate(self.layers)}
+        return report
         
     def save(self, prefix: Path = None) -> None:
         if self.layers is None:
@@ -61,23 +95,36 @@ class Pipeline(Node):
     
     def fit(self, x: DataDict, y: DataDict) -> Tuple[DataDict, DataDict]:
         self._compile_()
-        for layer in self.layers:
-            assert len(x) == len(y) == len(layer), 'Invalid shapes.'
-            x, y = layer.fit(x, y)
+        fingerprints = None
+        with ApplyToDataDict.use_backend(self.backend, self.n_workers, self.lazy), Tracer.use(self.tracer):
+            for i, layer in enumerate(self.layers):
+                assert len(x) == len(y) == len(layer), 'Invalid shapes.'
+                with Tracer.span(f'{layer.name}_{i}.fit', 'layer', x) as info:
+                    if self.cache is None:
+                        x, y = layer.fit(x, y)
+                    else:
+                        x, y, fingerprints = self.cache.fit(layer, x, y, fingerprints)
+                    info['output'] = x
         return x, y
     
     def predict_forward(self, x: DataDict) -> DataDict:
         if self.layers is None:
             raise Exception('Fit your model before.')
-        for layer in self.layers:     
-            x = layer.predict_forward(x)
+        with ApplyToDataDict.use_backend(self.backend, self.n_workers, self.lazy), Tracer.use(self.tracer):
+            for i, layer in enumerate(self.layers):
+                with Tracer.span(f'{layer.name}_{i}.predict_forward', 'layer', x) as info:
+                    x = layer.predict_forward(x)
+                    info['output'] = x
         return x
     
     def predict_backward(self, y: DataDict) -> DataDict:
         if self.layers is None:
             raise Exception('Fit your model before.')
-        for layer in self.layers[::-1]:
-            y = layer.predict_backward(y)
+        with ApplyToDataDict.use_backend(self.backend, self.n_workers, self.lazy), Tracer.use(self.tracer):
+            for i, layer in reversed(list(enumerate(self.layers))):
+                with Tracer.span(f'{layer.name}_{i}.predict_backward', 'layer', y) as info:
+                    y = layer.predict_backward(y)
+                    info['output'] = y
         return y
 
     def predict(self, x: DataDict) -> DataDict:
@@ -85,6 +132,12 @@ class Pipeline(Node):
         y1 = self.predict_backward(y2)
         return y1
 
+    def predict_stream(self, chunks: Iterable[DataDict]) -> Iterator[DataDict]:
+        """Predicts chunks of rows one by one, so memory is bounded by chunk size."""
+        for x in chunks:
+            y1 = self.predict(x)
+            yield y1
+
     def fit_predict(self, x: DataDict, y: DataDict) -> DataDict:
         x2, y2 = self.fit(x, y)
         y1 = self.predict_backward(y2)
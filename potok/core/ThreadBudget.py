@@ -0,0 +1,35 @@
+import os
+from contextlib import contextmanager
+from typing import List
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+
+class ThreadBudget:
+    """Splits cores budget between nodes running at the same time."""
+    def __init__(self, n_cores: int = None):
+        self.n_cores = n_cores if n_cores is not None else os.cpu_count()
+
+    def split(self, n_concurrent: int) -> List[int]:
+        assert n_concurrent >= 1, 'At least one node must be running.'
+        base, rest = divmod(self.n_cores, n_concurrent)
+        shares = [max(base + int(i < rest), 1) for i in range(n_concurrent)]
+        return shares
+
+    def assign(self, n_nodes: int, n_concurrent: int) -> List[int]:
+        shares = self.split(min(n_concurrent, n_nodes))
+        threads = [shares[i % len(shares)] for i in range(n_nodes)]
+        return threads
+
+
+@contextmanager
+def limit_threads(n_threads: int = None):
+    """Limits BLAS and OpenMP thread pools of NumPy and sklearn if threadpoolctl is installed."""
+    if n_threads is None or threadpool_limits is None:
+        yield
+    else:
+        with threadpool_limits(limits=n_threads):
+            yield
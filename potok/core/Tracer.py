@@ -0,0 +1,109 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from .Data import Data
+
+
+class Tracer:
+    """Records wall time, CPU time, rows and data size of node methods and ApplyToDataDict unit calls.
+    CPU time is CPU time of the process during the span, so it counts thread pools of models, e.g. OpenMP and BLAS,
+    and also spans running at the same time in other threads.
+    Spans are exported as Chrome trace JSON, which is opened in chrome://tracing or ui.perfetto.dev."""
+    # Tracer of the running pipeline in the current context, None means tracing is off.
+    active = contextvars.ContextVar('Tracer.active', default=None)
+
+    def __init__(self):
+        self.events = []
+
+    @classmethod
+    @contextmanager
+    def use(cls, tracer=None):
+        """Sets active tracer, e.g. per Pipeline, None keeps the current one."""
+        if tracer is None:
+            yield
+            return
+        token = cls.active.set(tracer)
+        try:
+            yield
+        finally:
+            cls.active.reset(token)
+
+    @staticmethod
+    def measure(data, prefix: str) -> dict:
+        if isinstance(data, tuple):
+            data = data[0]
+        if not isinstance(data, Data):
+            return {}
+        stats = data.stats()
+        return {prefix + '_' + k: v for k, v in stats.items()}
+
+    @classmethod
+    @contextmanager
+    def span(cls, name: str, category: str, data=None, **args):
+        """Records span into active tracer, output of traced call is passed by setting info['output']."""
+        tracer = cls.active.get()
+        info = {}
+        if tracer is None:
+            yield info
+            return
+
+        start, cpu_start = time.time_ns(), time.process_time_ns()
+        try:
+            yield info
+        finally:
+            end, cpu_end = time.time_ns(), time.process_time_ns()
+            args.update(cls.measure(data, 'input'))
+            args.update(cls.measure(info.get('output'), 'output'))
+            args['cpu_ms'] = (cpu_end - cpu_start) / 1e6
+            event = {'name': name, 'cat': category, 'ph': 'X',
+                     'ts': start / 1e3, 'dur': (end - start) / 1e3,
+                     'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args}
+            tracer.events.append(event)
+
+    @classmethod
+    def call(cls, func: Callable, name: str, category: str, key, *args, **kwargs):
+        """Calls func in span, first argument is measured as input."""
+        data = args[0] if args else None
+        with cls.span(name, category, data, key=str(key)) as info:
+            info['output'] = func(*args, **kwargs)
+        return info['output']
+
+    @classmethod
+    def call_remote(cls, traced: bool, func: Callable, *args, **kwargs):
+        """Traces call inside worker process or ray task, spans are returned back with the result."""
+        tracer = cls() if traced else None
+        with cls.use(tracer):
+            res = cls.call(func, *args, **kwargs)
+        events = tracer.events if traced else []
+        return res, events
+
+    def add(self, events: List[dict]) -> None:
+        self.events.extend(events)
+        return None
+
+    def report(self) -> Dict[str, dict]:
+        """Number of calls, total wall and CPU time in ms of every span name, slowest first."""
+        report = {}
+        for event in self.events:
+            row = report.setdefault(event['name'], {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0})
+            row['calls'] += 1
+            row['wall_ms'] += event['dur'] / 1e3
+            row['cpu_ms'] += event['args']['cpu_ms']
+        report = dict(sorted(report.items(), key=lambda item: item[1]['wall_ms'], reverse=True))
+        return report
+
+    def export(self, file_name: Path) -> None:
+        trace = {'traceEvents': self.events, 'displayTimeUnit': 'ms'}
+        with open(file_name, 'w') as json_file:
+            json.dump(trace, json_file)
+        return None
+
+    def clear(self) -> None:
+        self.events = []
+        return None
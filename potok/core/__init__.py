@@ -1,5 +1,8 @@
-from .Data import Data, DataDict
+from .Data import Data, DataDict, LazyDataDict, Thunk
 from .ApplyToDataDict import ApplyToDataDict
 from .Node import Node, Operator, Function, Regressor
 from .Layer import Layer
 from .Pipeline import Pipeline
+from .ThreadBudget import ThreadBudget
+from .LayerCache import LayerCache
+from .Tracer import Tracer
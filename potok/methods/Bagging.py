@@ -5,9 +5,14 @@ from potok.core import Operator, DataDict
 
 
 class Bagging(Operator):
-    def __init__(self, n_iter: int, **kwargs):
+    fitted_attributes = ('index',)
+
+    def __init__(self, n_iter: int, reduce: str = None, weights: list = None, **kwargs):
         super().__init__(**kwargs)
         self.n_iter = n_iter
+        # Reduction of bags predictions on backward: mean, median or rank, weights of bags.
+        self.reduce = reduce
+        self.weights = weights
         self.index = None
 
     def x_forward(self, x: DataDict) -> DataDict:
@@ -20,11 +25,13 @@ class Bagging(Operator):
         return y2
 
     def y_backward(self, y_frwd: DataDict) -> DataDict:
-        res = DataDict.combine(y_frwd.values())
+        params = {'method': self.reduce, 'weights': self.weights}
+        res = DataDict.combine(y_frwd.values(), **{k: v for k, v in params.items() if v is not None})
         return res
 
     def _repeat_(self, data: DataDict) -> DataDict:
         out = DataDict()
+        # Bags share the same data, nodes write through copy-on-write assign.
         for i in range(self.n_iter):
             out[f'Bag_{i + 1}'] = data
         return out
@@ -3,6 +3,8 @@ from potok.core import Operator, DataDict
 
 
 class Validation(Operator):
+    fitted_attributes = ('index',)
+
     def __init__(self, folder, **kwargs):
         super().__init__(**kwargs)
         self.folder = folder
@@ -36,10 +38,13 @@ class Validation(Operator):
 
     def y_backward(self, y_frwd: DataDict) -> DataDict:
         y_bck = self.folder.y_backward(y_frwd)
-        y = DataDict(train=y_bck['valid'])
-        units = y_bck.keys()
-        units.remove('valid')
-        y.__setstate__({unit: y_bck[unit] for unit in units})
+        # Units are moved as stored, so lazy units stay unevaluated.
+        units = dict(y_bck.raw_items())
+        y = y_bck.__class__()
+        # Valid is absent when only test data is predicted, e.g. chunk by chunk.
+        if 'valid' in units:
+            y['train'] = units.pop('valid')
+        y.__setstate__(units)
         y = y.reindex(self.index)
         return y
     
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Union
+
+from .TabularData import TabularData
+
+
+def import_dataset():
+    """pyarrow is optional, it is installed with arrow extra of potok."""
+    try:
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise Exception('Parquet and Arrow files need pyarrow, install it or potok[arrow].')
+    return ds
+
+
+@dataclass(init=False)
+class ArrowTabularData(TabularData):
+    """Tabular data backed by Parquet dataset or Arrow IPC file, files are memory mapped.
+    Only index is kept in memory, selected rows and columns are read on data access, so the frame
+    of a fold is never larger than the fold. Writes, e.g. copy(data=df), give in-memory TabularData."""
+    source: str
+
+    def __init__(self,
+                 source: Union[str, Path],
+                 target: list = None,
+                 index_col: Union[str, List[str]] = None,
+                 file_format: str = None,
+                 ):
+        assert isinstance(target, list), 'Invalid input type.'
+        self.source = str(source)
+        if file_format is None:
+            file_format = 'ipc' if Path(source).suffix in ('.arrow', '.feather', '.ipc') else 'parquet'
+        assert file_format in ('parquet', 'ipc'), f'Unknown file format = {file_format}.'
+        self.file_format = file_format
+        self.target = target
+        self.rows = None
+        self.columns = None
+        self._dataset_ = None
+        self._index_ = None
+
+        schema = self.dataset.schema
+        metadata = schema.pandas_metadata or {}
+        if index_col is None:
+            index_col = [col for col in metadata.get('index_columns', []) if isinstance(col, str)]
+        self.index_col = [index_col] if isinstance(index_col, str) else list(index_col)
+        self.base_columns = [name for name in schema.names
+                             if name not in self.index_col and not name.startswith('__index_level_')]
+        self.base_index = self._read_index_(metadata)
+
+    @property
+    def dataset(self):
+        if self._dataset_ is None:
+            ds = import_dataset()
+            import pyarrow.fs as fs
+            self._dataset_ = ds.dataset(self.source, format=self.file_format,
+                                        filesystem=fs.LocalFileSystem(use_mmap=True))
+        return self._dataset_
+
+    def _read_index_(self, metadata: dict) -> pd.Index:
+        if not self.index_col:
+            n_rows = self.dataset.count_rows()
+            ranges = [col for col in metadata.get('index_columns', []) if isinstance(col, dict)]
+            if len(ranges) == 1 and len(self.dataset.files) == 1:
+                # RangeIndex is stored in pandas metadata only.
+                index = pd.RangeIndex(ranges[0]['start'], ranges[0]['stop'], ranges[0]['step'], name=ranges[0]['name'])
+                if len(index) == n_rows:
+                    return index
+            return pd.RangeIndex(n_rows)
+        df = self.dataset.to_table(columns=self.index_col).to_pandas()
+        if len(self.index_col) == 1:
+            return pd.Index(df[self.index_col[0]], name=self.index_col[0])
+        return pd.MultiIndex.from_frame(df)
+
+    def _read_(self, columns: list) -> pd.DataFrame:
+        if self.rows is None:
+            table = self.dataset.to_table(columns=columns)
+        else:
+            # Row selection is pushed down into the reader.
+            table = self.dataset.take(self.rows, columns=columns)
+        df = table.to_pandas()
+        df.index = self.index
+        return df
+
+    @property
+    def data(self) -> pd.DataFrame:
+        return self._read_(self.all_columns)
+
+    @data.setter
+    def data(self, df: pd.DataFrame) -> None:
+        raise Exception('ArrowTabularData is read only, use copy(data=df).')
+
+    def __getstate__(self) -> dict:
+        # Selection is pickled instead of rows, workers read them from the file.
+        state = self.__dict__.copy()
+        state.update(_dataset_=None, _index_=None)
+        return state
+
+    def copy(self, **kwargs) -> TabularData:
+        if 'data' in kwargs:
+            new = TabularData(kwargs.pop('data'), self.target)
+            new.__dict__.update(kwargs)
+            return new
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        if 'rows' in kwargs:
+            kwargs['_index_'] = None
+        new.__dict__.update(kwargs)
+        return new
+
+    @property
+    def all_columns(self) -> list:
+        return list(self.columns) if self.columns is not None else list(self.base_columns)
+
+    @property
+    def index(self):
+        if self.rows is None:
+            return self.base_index
+        if self._index_ is None:
+            self._index_ = self.base_index[self.rows]
+        return self._index_
+
+    def take(self, positions: Union[np.ndarray, slice]) -> TabularData:
+        if isinstance(positions, slice):
+            positions = np.arange(len(self))[positions]
+        return super().take(positions)
+
+    def feature_matrix(self, features: list) -> pd.DataFrame:
+        return self._read_(list(features))
+
+    def reindex(self, index) -> TabularData:
+        if not self.index.is_unique:
+            return self.copy(data=self.data.reindex(index))
+        positions = self.index.get_indexer(index)
+        if (positions >= 0).all():
+            return self.take(positions)
+        df = self.take(np.unique(positions[positions >= 0])).data.reindex(index)
+        return self.copy(data=df)
+
+    def fingerprint(self) -> str:
+        # Files are identified by path, size and modification time instead of content.
+        files = sorted(self.dataset.files)
+        key = hashlib.sha1(repr([(f, os.path.getsize(f), os.path.getmtime(f)) for f in files]).encode())
+        rows = self.rows if self.rows is not None else np.array([], dtype=np.int64)
+        key.update(np.asarray(rows).tobytes())
+        key.update(repr((self.all_columns, self.target)).encode())
+        return key.hexdigest()
+
+    def stats(self) -> dict:
+        return {'rows': len(self), 'bytes': None}
+
+    def __len__(self) -> int:
+        return len(self.rows) if self.rows is not None else len(self.base_index)
@@ -0,0 +1,136 @@
+import hashlib
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Union
+
+from .TabularData import TabularData
+
+
+@dataclass(init=False)
+class BlockTabularData(TabularData):
+    """Tabular data stored as a contiguous float NumPy block with column name to offset map and separate index.
+    Contiguous column selections and row slices are views of the block, DataFrame is built around the block."""
+    base: np.ndarray
+
+    def __init__(self,
+                 block: np.ndarray,
+                 columns: list,
+                 index: pd.Index = None,
+                 target: list = None,
+                 ):
+        assert isinstance(target, list) and isinstance(block, np.ndarray), 'Invalid input type.'
+        assert block.ndim == 2 and block.shape[1] == len(columns), 'Block and columns shapes must be same.'
+        self.base = block
+        self.base_index = pd.RangeIndex(len(block)) if index is None else pd.Index(index)
+        self.base_columns = list(columns)
+        self.offsets = {col: i for i, col in enumerate(self.base_columns)}
+        self.rows = None
+        self.columns = None
+        self.target = target
+        self._index_ = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, target: list, dtype=np.float64) -> 'BlockTabularData':
+        block = np.ascontiguousarray(df.to_numpy(dtype=dtype))
+        return cls(block, list(df.columns), df.index, target)
+
+    @property
+    def values(self) -> np.ndarray:
+        """Block of selected rows and columns, a view when selection is contiguous."""
+        block = self.base
+        cols = slice(None)
+        if self.columns is not None:
+            offsets = [self.offsets[col] for col in self.columns]
+            start = offsets[0] if offsets else 0
+            contiguous = offsets == list(range(start, start + len(offsets)))
+            cols = slice(start, start + len(offsets)) if contiguous else np.asarray(offsets)
+        rows = self.rows if self.rows is not None else slice(None)
+        if isinstance(rows, np.ndarray) and isinstance(cols, np.ndarray):
+            return block[np.ix_(rows, cols)]
+        return block[rows][:, cols]
+
+    @property
+    def data(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.index, columns=self.all_columns, copy=False)
+
+    @data.setter
+    def data(self, df: pd.DataFrame) -> None:
+        self.__dict__.update(self._from_frame_state_(df))
+
+    def _from_frame_state_(self, df: pd.DataFrame) -> dict:
+        new = self.from_frame(df, self.target, self.base.dtype)
+        return new.__dict__
+
+    def __getstate__(self) -> dict:
+        # Selection is materialized, so only selected rows are pickled.
+        state = self.__dict__.copy()
+        if self.is_view:
+            state.update(base=np.ascontiguousarray(self.values), base_index=self.index, base_columns=self.all_columns,
+                         offsets={col: i for i, col in enumerate(self.all_columns)}, rows=None, columns=None)
+        state['_index_'] = None
+        return state
+
+    def __len__(self) -> int:
+        if isinstance(self.rows, slice):
+            return len(range(len(self.base))[self.rows])
+        return len(self.rows) if self.rows is not None else len(self.base)
+
+    def copy(self, **kwargs) -> 'BlockTabularData':
+        if 'data' in kwargs:
+            kwargs.update(self._from_frame_state_(kwargs.pop('data')))
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        if 'base' in kwargs or 'rows' in kwargs:
+            kwargs['_index_'] = None
+        new.__dict__.update(kwargs)
+        return new
+
+    def take(self, positions: Union[np.ndarray, slice]) -> 'BlockTabularData':
+        """Rows at positions or slice of rows, slices of rows are views of the block."""
+        if self.rows is None:
+            rows = positions if isinstance(positions, slice) else np.asarray(positions)
+        elif isinstance(self.rows, slice):
+            rows = np.arange(len(self.base))[self.rows][positions]
+        else:
+            rows = self.rows[positions]
+        new = self.copy(rows=rows)
+        return new
+
+    @property
+    def all_columns(self) -> list:
+        return list(self.columns) if self.columns is not None else list(self.base_columns)
+
+    @property
+    def index(self):
+        if self.rows is None:
+            return self.base_index
+        if self._index_ is None:
+            self._index_ = self.base_index[self.rows]
+        return self._index_
+
+    def feature_matrix(self, features: list) -> np.ndarray:
+        return self[list(features)].values
+
+    def reindex(self, index) -> 'BlockTabularData':
+        if not self.index.is_unique:
+            return self.copy(data=self.data.reindex(index))
+        positions = self.index.get_indexer(index)
+        if (positions >= 0).all():
+            return self.take(positions)
+        # Absent labels are filled with NaN rows.
+        block = np.full((len(positions), len(self.all_columns)), np.nan, dtype=self.base.dtype)
+        found = positions >= 0
+        block[found] = self.take(positions[found]).values
+        new = self.__class__(block, self.all_columns, index, self.target)
+        return new
+
+    def fingerprint(self) -> str:
+        key = hashlib.sha1(np.ascontiguousarray(self.values).tobytes())
+        key.update(pd.util.hash_pandas_object(self.index).to_numpy().tobytes())
+        key.update(repr((self.all_columns, str(self.base.dtype), self.target)).encode())
+        return key.hexdigest()
+
+    def stats(self) -> dict:
+        size = len(self) * len(self.all_columns) * self.base.itemsize + self.index.memory_usage()
+        return {'rows': len(self), 'bytes': int(size)}
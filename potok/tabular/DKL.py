@@ -1,5 +1,3 @@
-import tensorflow as tf
-import tensorflow_probability as tfp
 import pandas as pd
 import numpy as np
 import functools
@@ -12,6 +10,7 @@ from ..core import Operator, DataDict
 def make_val_and_grad_fn(value_fn):
     @functools.wraps(value_fn)
     def val_and_grad(x):
+        import tensorflow_probability as tfp
         return tfp.math.value_and_gradient(value_fn, x)
     return val_and_grad
 
@@ -24,6 +23,8 @@ def make_val_and_grad_fn(value_fn):
 
 
 class Dkl(Operator):
+    fitted_attributes = ('train_weights', 'weight_params', 'status')
+
     def __init__(self, indx_list, weight_col='W', **kwargs):
         super().__init__(**kwargs)
         assert len(indx_list) != 0
@@ -81,6 +82,7 @@ class Dkl(Operator):
         """train: n*k, valid:n1*k
             kernel_matrix: n*m
             moments: 1*m"""
+        import tensorflow as tf
         train = tf.convert_to_tensor(train.to_numpy(), dtype=tf.float64)
         valid = tf.convert_to_tensor(valid.to_numpy(), dtype=tf.float64)
 
@@ -109,6 +111,7 @@ class Dkl(Operator):
         """matrix: n*m
         alpha: m*1
         P: n*1"""
+        import tensorflow as tf
         matrix_alpha = tf.linalg.tensordot(kernel_matrix, alpha, axes=1)
         P = tf.math.exp(matrix_alpha - tf.math.reduce_mean(matrix_alpha, keepdims=True))
         P /= tf.math.reduce_sum(P, keepdims=True)
@@ -116,12 +119,14 @@ class Dkl(Operator):
     
     @staticmethod
     def data_eff(P):
+        import tensorflow as tf
         Hp = -tf.linalg.tensordot(P, tf.math.log(P), axes=1)
         data_eff = tf.math.exp(Hp) / P.shape[0]
         return data_eff.numpy()
     
     @staticmethod
     def Dkl(P):
+        import tensorflow as tf
         Hp = tf.linalg.tensordot(P, tf.math.log(P), axes=1)
         Huniform = tf.math.log(tf.constant(P.shape[0], tf.float64))
         dkl = Hp + Huniform
@@ -129,6 +134,7 @@ class Dkl(Operator):
 
     @staticmethod
     def check_P(P):
+        import tensorflow as tf
         status = False
         if tf.math.reduce_all(tf.math.is_finite(P)).numpy():
             if 0.9 <= tf.math.reduce_sum(P).numpy() <= 1.1:
@@ -137,6 +143,7 @@ class Dkl(Operator):
     
     @staticmethod
     def check_solution(res):
+        import tensorflow as tf
         status = False
         if res.converged:
             if res.objective_value.numpy() < 10e-3:
@@ -145,6 +152,9 @@ class Dkl(Operator):
         return status
 
     def calc_weights(self, train, valid):
+        import tensorflow as tf
+        import tensorflow_probability as tfp
+
         @make_val_and_grad_fn
         def opt_func(alpha):
             """matrix: n*m
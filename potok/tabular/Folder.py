@@ -1,4 +1,5 @@
 from sklearn.model_selection import KFold, train_test_split, TimeSeriesSplit
+import hashlib
 import pandas as pd
 import numpy as np
 
@@ -6,56 +7,83 @@ from ..core import Operator, DataDict
 
 
 class Folder(Operator):
+    fitted_attributes = ('folds', 'index_key')
+
     def __init__(self,
                  n_folds: int = 5,
                  split_ratio: float = 0.2,
                  index_name: str = None,
                  seed: int = 4242,
+                 reduce: str = None,
+                 weights: list = None,
                  **kwargs) -> None:
         super().__init__(**kwargs)
         self.n_folds = n_folds
         self.split_ratio = split_ratio
         self.index_name = index_name
         self.seed = seed
+        # Reduction of folds predictions on backward: mean, median or rank, weights of folds e.g. by validation error.
+        self.reduce = reduce
+        self.weights = weights
+        # Folds are int32 positions of rows in train data, they are valid for train with the same index only.
         self.folds = None
+        self.index_key = None
 
     def _fit_(self, x: DataDict, y: DataDict) -> None:
         assert x['train'] is not None, 'Train data is required.'
+        self.index_key = self._index_key_(x['train'].index)
         if self.index_name is not None:
             self.folds = self.generate_folds_by_index(x, y)
         else:
             self.folds = self.generate_folds(x, y)
         return None
 
-    def generate_folds(self, x: DataDict, y: DataDict) -> dict:
-        index = x['train'].index
-        
+    @staticmethod
+    def _index_key_(index) -> tuple:
+        """Length and hash of train index in its order."""
+        values = pd.util.hash_pandas_object(pd.Index(index), index=False).to_numpy()
+        return len(values), hashlib.sha1(values.tobytes()).hexdigest()
+
+    @staticmethod
+    def _positions_(mask: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(mask).astype(np.int32)
+
+    @classmethod
+    def _group_folds_(cls, codes: np.ndarray, n_groups: int, splits) -> DataDict:
+        """Folds of rows positions given splits of groups, groups are codes of factorized index level."""
+        folds = {}
+        for i, (train_idx, valid_idx) in enumerate(splits):
+            fold_groups = np.zeros(n_groups, dtype=np.int8)
+            fold_groups[train_idx] = 1
+            fold_groups[valid_idx] = 2
+            fold_rows = fold_groups[codes]
+            folds[f'Fold_{i + 1}'] = DataDict(train=cls._positions_(fold_rows == 1),
+                                              valid=cls._positions_(fold_rows == 2))
+        return DataDict(folds)
+
+    def generate_folds(self, x: DataDict, y: DataDict) -> DataDict:
+        positions = np.arange(len(x['train']), dtype=np.int32)
+
         if self.n_folds > 1:
             folder = KFold(n_splits=self.n_folds, shuffle=True, random_state=self.seed)
-            folds = DataDict(**{f'Fold_{i+1}': DataDict(train=index[train_idx], valid=index[valid_idx])
-                                for i, (train_idx, valid_idx) in enumerate(folder.split(index))})
+            folds = DataDict({f'Fold_{i+1}': DataDict(train=train_idx.astype(np.int32), valid=valid_idx.astype(np.int32))
+                              for i, (train_idx, valid_idx) in enumerate(folder.split(positions))})
         else:
-            train_idx, valid_idx = train_test_split(index, test_size=self.split_ratio, random_state=self.seed)
-            folds = {'Fold_1': DataDict(train=index[train_idx], valid=index[valid_idx])}
+            train_idx, valid_idx = train_test_split(positions, test_size=self.split_ratio, random_state=self.seed)
+            folds = DataDict(Fold_1=DataDict(train=train_idx, valid=valid_idx))
         return folds
 
     def generate_folds_by_index(self, x: DataDict, y: DataDict) -> DataDict:
-        index = x['train'].index
-        values = x['train'].index.get_level_values(self.index_name).unique().to_numpy()
+        # Index level is factorized once, folds are assigned to groups and broadcast to rows by codes.
+        codes, values = pd.factorize(x['train'].index.get_level_values(self.index_name))
+        groups = np.arange(len(values))
 
         if self.n_folds > 1:
             folder = KFold(n_splits=self.n_folds, shuffle=True, random_state=self.seed)
-
-            folds = DataDict(**{f'Fold_{i+1}':
-                                DataDict(
-                                    train=index[index.get_level_values(self.index_name).isin(values[train_idx])],
-                                    valid=index[index.get_level_values(self.index_name).isin(values[valid_idx])])
-                                for i, (train_idx, valid_idx) in enumerate(folder.split(values))})
+            splits = folder.split(groups)
         else:
-            train_idx, valid_idx = train_test_split(values, test_size=self.split_ratio, random_state=self.seed)
-            folds = DataDict(**{'Fold_1':
-                         DataDict(train=index[index.get_level_values(self.index_name).isin(values[train_idx])],
-                                  valid=index[index.get_level_values(self.index_name).isin(values[valid_idx])])})
+            splits = [train_test_split(groups, test_size=self.split_ratio, random_state=self.seed)]
+        folds = self._group_folds_(codes, len(values), splits)
         return folds
 
     def x_forward(self, x: DataDict) -> DataDict:
@@ -68,17 +96,26 @@ class Folder(Operator):
 
     def y_backward(self, y_frwd: DataDict) -> DataDict:
         if self.n_folds > 1:
-            y_frwd = DataDict.combine(y_frwd.values())
+            y_frwd = DataDict.combine(y_frwd.values(), **self.combine_params)
         return y_frwd
 
+    @property
+    def combine_params(self) -> dict:
+        params = {'method': self.reduce, 'weights': self.weights}
+        return {k: v for k, v in params.items() if v is not None}
+
     def get_folds(self, xy: DataDict) -> DataDict:
         units = xy.keys()
         if 'train' in units:
             units = [unit + f'_{i}' if unit == 'valid' else unit for i, unit in enumerate(units)]
             units.remove('train')
-            valid_xy = DataDict(train=xy['train'], valid=xy['train'])
-            folds = {k: valid_xy.get_by_index(v) for k, v in self.folds.items()}
-            [fold.__setstate__({unit: xy[unit] for unit in units}) for k, fold in folds.items()]
+            train = xy['train']
+            if self.index_key is not None and self._index_key_(train.index) != self.index_key:
+                raise Exception('Train rows differ from rows folds were fitted on, positions of folds can not be applied.')
+            # Other units are shared as stored, so lazy units stay unevaluated.
+            stored = dict(xy.raw_items())
+            folds = {k: xy.__class__(train=train.take(v['train']), valid=train.take(v['valid'])) for k, v in self.folds.items()}
+            [fold.__setstate__({unit: stored.get(unit) for unit in units}) for k, fold in folds.items()]
         else:
             folds = {f'Fold_{i+1}': xy for i in range(self.n_folds)}
         return DataDict(**folds)
@@ -90,19 +127,13 @@ class FolderByTime(Folder):
                  split_ratio: float = 0.2,
                  index_name: str = None,
                  seed: int = 4242,
+                 reduce: str = None,
+                 weights: list = None,
                  **kwargs):
-        super().__init__(n_folds, split_ratio, index_name, seed, **kwargs)
+        super().__init__(n_folds, split_ratio, index_name, seed, reduce, weights, **kwargs)
 
     def generate_folds_by_index(self, x: DataDict, y: DataDict) -> DataDict:
-        index = x['train'].index
-        values = np.sort(x['train'].index.get_level_values(self.index_name).unique().to_numpy())
-
+        codes, values = pd.factorize(x['train'].index.get_level_values(self.index_name), sort=True)
         folder = TimeSeriesSplit(n_splits=self.n_folds)
-
-        folds = DataDict(**{f'Fold_{i + 1}':
-                            DataDict(train=index[index.get_level_values(self.index_name).isin(values[train_idx])],
-                                     valid=index[index.get_level_values(self.index_name).isin(values[valid_idx])])
-                                         for i, (train_idx, valid_idx) in enumerate(folder.split(values))})
-
+        folds = self._group_folds_(codes, len(values), folder.split(np.arange(len(values))))
         return folds
-
@@ -1,8 +1,6 @@
 from pprint import pprint
 from typing import Union
-from collections import Mapping, Set, Sequence
-
-from ax import ParameterType, RangeParameter, ChoiceParameter, SearchSpace, SimpleExperiment, modelbridge
+from collections.abc import Mapping, Set, Sequence
 
 from ..core import Function
 
@@ -30,6 +28,8 @@ class HyperParamOptimization(Function):
         self._best_values_ = None
 
     def fit(self, x, y):
+        from ax import ParameterType, RangeParameter, ChoiceParameter, SearchSpace, SimpleExperiment, modelbridge
+
         opt_range_dict = DeepSearch(HrPrmOptRange).get_places(self.leaf)
         opt_choise_dict = DeepSearch(HrPrmOptChoise).get_places(self.leaf)
 
@@ -0,0 +1,109 @@
+import numpy as np
+from typing import List, Union
+
+from ..core import Pipeline, DataDict
+from ..methods import Bagging, Validation
+from .LightGBM import LightGBM
+from .LinReg import LinReg
+from .Operators import TransformY
+
+
+class InferencePlan:
+    """Fitted Pipeline compiled into flat operations on NumPy arrays for low-latency scoring.
+    Supports Bagging, Validation, TransformY and a final layer of LightGBM or LinReg models.
+    With merge, LightGBM regressors averaged by the innermost mean are merged into one booster per group."""
+    def __init__(self, pipeline: Pipeline, num_threads: int = 1, merge: bool = False):
+        if pipeline.layers is None:
+            raise Exception('Fit your model before.')
+        assert len(pipeline.layers[0]) == 1, 'Only pipelines with single input are supported.'
+        self.num_threads = num_threads
+
+        *operators, models = pipeline.layers
+        self.stages = []
+        for layer in operators:
+            node = layer[0]
+            reducer = node.folder if isinstance(node, Validation) else node
+            if getattr(reducer, 'reduce', None) not in (None, 'mean') or getattr(reducer, 'weights', None) is not None:
+                raise Exception(f'Only unweighted mean reduction of {node.name} is supported by InferencePlan.')
+            if isinstance(node, Bagging):
+                self.stages.append(('mean', node.n_iter))
+            elif isinstance(node, Validation):
+                if node.folder.n_folds > 1:
+                    self.stages.append(('mean', node.folder.n_folds))
+            elif isinstance(node, TransformY):
+                self.stages.append(('transform', node.backward))
+            else:
+                raise Exception(f'Node {node.name} is not supported by InferencePlan.')
+        self.stages = self._merge_means_(self.stages[::-1])
+        n_models = int(np.prod([value for kind, value in self.stages if kind == 'mean']))
+        assert n_models == len(models), 'Pipeline structure is not supported by InferencePlan.'
+
+        self.features = list(models[0].features)
+        assert all(list(node.features) == self.features for node in models), 'Models features must be same.'
+        if isinstance(models[0], LinReg):
+            self.kind = 'linear'
+            self.columns = list(models[0].target)
+            coefs = [np.atleast_2d(node.model.coef_) for node in models]
+            self.weights = np.stack([coef.T for coef in coefs])
+            self.intercepts = np.stack([np.atleast_1d(node.model.intercept_) for node in models])
+        elif isinstance(models[0], LightGBM):
+            self.kind = models[0].mode
+            self.columns = list(models[0].target) if self.kind == 'Regressor' else None
+            boosters = [node.booster for node in models]
+            if merge:
+                assert self.kind == 'Regressor', 'Only LightGBM regressors can be merged.'
+                if self.stages and self.stages[0][0] == 'mean':
+                    # Groups of models averaged first are scored by one booster, its trees are traversed once.
+                    _, size = self.stages.pop(0)
+                    boosters = [LightGBM.merge_boosters(boosters[i:i + size]) for i in range(0, len(boosters), size)]
+            self.boosters = [(booster, booster.best_iteration) for booster in boosters]
+        else:
+            raise Exception(f'Node {models[0].name} is not supported by InferencePlan.')
+
+    @staticmethod
+    def _merge_means_(stages: list) -> list:
+        # Mean of equal sized group means is a mean over the whole group, so reductions are merged.
+        merged = []
+        for kind, value in stages:
+            if kind == 'mean' and merged and merged[-1][0] == 'mean':
+                merged[-1] = ('mean', merged[-1][1] * value)
+            else:
+                merged.append((kind, value))
+        return merged
+
+    def _to_array_(self, x: Union[dict, np.ndarray]) -> np.ndarray:
+        if isinstance(x, dict):
+            x = np.column_stack([np.atleast_1d(x[f]) for f in self.features])
+        return np.atleast_2d(np.asarray(x, dtype=np.float64))
+
+    def _predict_models_(self, x: np.ndarray) -> np.ndarray:
+        """Predictions of all models with shape (models, rows, outputs)."""
+        if self.kind == 'linear':
+            return np.einsum('rf,mfo->mro', x, self.weights) + self.intercepts[:, None, :]
+        preds = []
+        for booster, best_iteration in self.boosters:
+            pred = booster.predict(x, num_iteration=best_iteration, num_threads=self.num_threads)
+            if self.kind == 'Classifier' and pred.ndim == 1:
+                pred = np.column_stack([1 - pred, pred])
+            preds.append(pred.reshape(len(x), -1))
+        return np.stack(preds)
+
+    def predict(self, x: Union[dict, np.ndarray]) -> np.ndarray:
+        """Predicts rows given as 2d array in features order or dict of feature values."""
+        preds = self._predict_models_(self._to_array_(x))
+        for kind, value in self.stages:
+            if kind == 'mean':
+                preds = preds.reshape(-1, value, *preds.shape[1:]).mean(axis=1)
+            else:
+                preds = value(preds)
+        return preds[0]
+
+    def verify(self, pipeline: Pipeline, x: DataDict, unit: str = 'test', rtol: float = 1e-6) -> float:
+        """Checks that plan predictions match Pipeline.predict, returns max absolute difference."""
+        expected = pipeline.predict(x)
+        expected = expected[expected.keys()[0]][unit].data
+        data = x[x.keys()[0]][unit].data
+        predicted = self.predict(data[self.features].to_numpy())
+        expected = expected.reindex(data.index).to_numpy()
+        assert np.allclose(predicted, expected, rtol=rtol, equal_nan=True), 'Plan does not match Pipeline.predict.'
+        return float(np.nanmax(np.abs(predicted - expected)))
@@ -1,5 +1,9 @@
-import lightgbm as lgb
+import hashlib
+import json
+import weakref
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from pathlib import Path
 import joblib
 # from typing import List, Iterator, Tuple
@@ -9,7 +13,70 @@ from .TabularData import TabularData
 from .HyperOptimization import HrPrmOptRange, HrPrmOptChoise
 
 
+class DatasetCache:
+    """Binned lgb.Dataset shared by copies of LightGBM node, e.g. by bags and hyperparameter trials.
+    Datasets are keyed by fingerprints of features, labels and binning params, raw data is freed after binning.
+    Contents are not pickled, so cache does not change node fingerprint and is not saved."""
+    # Params which change binning of Dataset, other params may vary between trainings on the same Dataset.
+    binning_params = ('max_bin', 'max_bin_by_feature', 'min_data_in_bin', 'bin_construct_sample_cnt',
+                      'use_missing', 'zero_as_missing', 'linear_tree', 'data_random_seed')
+
+    def __init__(self, max_entries: int = None):
+        # Every fold needs train and valid Datasets, bags visit folds in cycle, so a bound smaller than
+        # 2 * n_folds never gives a hit, the cache is unbounded by default.
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits, self.builds = 0, 0
+
+    def __getstate__(self) -> dict:
+        return {'max_entries': self.max_entries, 'entries': OrderedDict(), 'hits': 0, 'builds': 0}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def dataset_params(cls, params: dict) -> dict:
+        dataset_params = {k: v for k, v in params.items() if k in cls.binning_params}
+        # Prefiltering depends on min_data_in_leaf, it is off, so the param may vary between trials.
+        dataset_params.update(feature_pre_filter=False, verbose=-1)
+        return dataset_params
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        key = hashlib.sha1()
+        for part in parts:
+            key.update(repr(part).encode())
+        return key.hexdigest()
+
+    def get(self, key: str, build):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        dataset = build()
+        self.builds += 1
+        self.entries[key] = dataset
+        while self.max_entries is not None and len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return dataset
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
 class LightGBM(Regressor):
+    # Boosters loaded in this process by model file, nodes loading the same file share one booster.
+    # Values are weak, so a booster is freed with the last node using it.
+    boosters = weakref.WeakValueDictionary()
+    manifest_name = 'lightgbm.json'
+    # Objectives which prediction is raw score, so mean of predictions is prediction of merged trees.
+    identity_objectives = ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape')
+    fitted_attributes = ('model', 'cat_features_idx', 'feature_importance_df')
+    execution_attributes = Regressor.execution_attributes + ('predict_chunk_size', 'predict_n_threads')
+
     def __init__(self,
                  target=None,
                  features=None,
@@ -19,6 +86,10 @@ class LightGBM(Regressor):
                  eval_metric='mse',
                  num_class=None,
                  weight=None,
+                 cache_dataset=False,
+                 dataset_cache_size=None,
+                 predict_chunk_size=None,
+                 predict_n_threads=None,
                  **kwargs,
                  ):
 
@@ -28,6 +99,12 @@ class LightGBM(Regressor):
         self.cat_features = cat_features
         self.mode = mode
         self.weight = weight
+        # Binned train and valid Datasets are reused by node copies, model is trained with lgb.train then.
+        assert not cache_dataset or mode == 'Regressor', 'Dataset cache supports only Regressor mode.'
+        self.dataset_cache = DatasetCache(dataset_cache_size) if cache_dataset else None
+        # Rows are predicted by chunks of this size, so memory is bounded by chunk and output size.
+        self.predict_chunk_size = predict_chunk_size
+        self.predict_n_threads = predict_n_threads
 
         self.model_params = dict(
             n_estimators=2000,
@@ -63,39 +140,122 @@ class LightGBM(Regressor):
         return None
 
     def _save_(self, prefix: Path = None) -> None:
-        path = prefix / 'lightgbm.pkl'
-        if self.model is not None:
-            joblib.dump(self.model, path)
+        """Saves booster in LightGBM text format along with manifest, sklearn estimator is not pickled."""
+        if self.model is None:
+            return None
+        import lightgbm as lgb
+        booster = self.booster
+        model_file = 'lightgbm.txt'
+        booster.save_model(str(prefix / model_file), num_iteration=booster.best_iteration)
+        manifest = {'format': 'text', 'model_file': model_file, 'lightgbm': lgb.__version__, 'mode': self.mode,
+                    'target': self.target, 'features': list(booster.feature_name()),
+                    'num_trees': booster.num_trees(), 'best_iteration': booster.best_iteration}
+        with open(prefix / self.manifest_name, 'w') as json_file:
+            json.dump(manifest, json_file, indent=2)
+        return None
 
     def _load_(self, prefix: Path = None) -> None:
-        path = prefix / 'lightgbm.pkl'
+        """Loads predict-only booster, pickled sklearn estimators of older saves are loaded as they are."""
+        if (prefix / 'lightgbm.pkl').exists():
+            self.model = joblib.load(prefix / 'lightgbm.pkl')
+            return None
         try:
-            self.model = joblib.load(path)
+            with open(prefix / self.manifest_name) as json_file:
+                manifest = json.load(json_file)
         except OSError:
             raise Exception('Cant find Model weights.')
+        assert manifest['format'] == 'text', f"Unknown model format = {manifest['format']}."
+        assert manifest['mode'] == self.mode, 'Saved model mode does not match node.'
+        assert self.target is None or list(self.target) == manifest['target'], 'Saved model target does not match node.'
+        assert self.features is None or list(self.features) == manifest['features'], \
+            'Saved model features do not match node.'
+        self.model = self.load_booster(prefix / manifest['model_file'])
+        return None
+
+    @classmethod
+    def load_booster(cls, path: Path):
+        """Booster of LightGBM model file, it is parsed once per process and shared by nodes loading the same file.
+        Boosters loaded before forking workers are shared by them as copy-on-write memory."""
+        import lightgbm as lgb
+        stat = path.stat()
+        key = str(path.resolve()), stat.st_mtime_ns, stat.st_size
+        booster = cls.boosters.get(key)
+        if booster is None:
+            booster = lgb.Booster(model_file=str(path))
+            cls.boosters[key] = booster
+        return booster
+
+    @staticmethod
+    def merge_boosters(boosters: list, weights: list = None):
+        """Single booster which score is weighted sum of scores of boosters, leaf values of trees are scaled by weights.
+        Weights are 1 / n by default, so the merged booster predicts mean of boosters in one pass over trees.
+        Only single output objectives with identity link are supported, e.g. regression."""
+        import re
+        import lightgbm as lgb
+        weights = np.full(len(boosters), 1 / len(boosters)) if weights is None else np.asarray(weights, dtype=np.float64)
+        assert len(weights) == len(boosters), 'Number of weights and boosters must be same.'
+        # Trees are put under header of the first booster, so features must be same.
+        assert all(booster.feature_name() == boosters[0].feature_name() for booster in boosters), \
+            'Boosters with different features can not be merged.'
+        heads, trees = [], []
+        for booster, weight in zip(boosters, weights):
+            model = booster.model_to_string(num_iteration=booster.best_iteration)
+            start, end = model.index('\nTree='), model.index('\nend of trees')
+            heads.append((model[:start], model[end:]))
+            # Extra tokens change the link, e.g. 'regression sqrt' squares the raw score.
+            objective = re.search(r'^objective=(.*)$', model[:start], re.M).group(1).strip()
+            if objective not in LightGBM.identity_objectives or 'num_tree_per_iteration=1\n' not in model[:start]:
+                raise Exception(f'Boosters with objective = {objective} can not be merged.')
+            for block in model[start:end].split('\nTree=')[1:]:
+                lines = block.strip('\n').split('\n')[1:]
+                assert 'is_linear=1' not in lines, 'Linear trees can not be merged.'
+                for i, line in enumerate(lines):
+                    name, _, values = line.partition('=')
+                    if name in ('leaf_value', 'internal_value'):
+                        lines[i] = name + '=' + ' '.join(repr(float(v) * weight) for v in values.split())
+                trees.append(lines)
+        head, tail = heads[0]
+        # Tree sizes are optional, trees are parsed one by one without them.
+        head = re.sub(r'^tree_sizes=.*\n', '', head, flags=re.M)
+        tail = re.sub(r'\nfeature_importances:\n.*?\n\n', '\n', tail, flags=re.S)
+        body = ''.join(f'Tree={i}\n' + '\n'.join(lines) + '\n\n\n' for i, lines in enumerate(trees))
+        return lgb.Booster(model_str=head + '\n' + body + tail.lstrip('\n'))
 
     def _set_model_(self):
+        import lightgbm as lgb
         if self.mode == 'Regressor':
             self.model = lgb.LGBMRegressor()
         elif self.mode == 'Classifier':
             self.model = lgb.LGBMClassifier()
         else:
             raise Exception('Unknown mode %s' % self.mode)
+        self.model.set_params(**self._model_params_())
+
+    def _model_params_(self) -> dict:
         params = {k: (x.value if isinstance(x, (HrPrmOptRange, HrPrmOptChoise)) else x) for k, x in self.model_params.items()}
-        self.model.set_params(**params)
+        if self.n_threads is not None:
+            params['n_jobs'] = self.n_threads
+        return params
+
+    @property
+    def booster(self):
+        """Fitted lgb.Booster, it is wrapped by sklearn estimator unless dataset cache is used or model is loaded."""
+        return self.model.booster_ if hasattr(self.model, 'booster_') else self.model
 
     def _fit_(self, x: DataDict, y: DataDict) -> None:
+        if self.dataset_cache is not None:
+            return self._fit_booster_(x, y)
         self._set_model_()
 
         if self.target is None:
             self.target = x['train'].target
 
         if self.features is None:
-            self.features = x['train'].data.columns
+            self.features = x['train'].all_columns
 
-        x_train, x_valid = x['train'].data[self.features], x['valid'].data[self.features]
         y_train, y_valid = y['train'].data.dropna()[self.target], y['valid'].data[self.target]
-        x_train = x_train.reindex(y_train.index)
+        x_train = x['train'].reindex(y_train.index).feature_matrix(self.features)
+        x_valid = x['valid'].feature_matrix(self.features)
 
         if self.weight is not None:
             w_train, w_valid = y['train'].data.dropna()[self.weight], y['valid'].data[self.weight]
@@ -117,26 +277,100 @@ class LightGBM(Regressor):
 
         self.model = self.model.fit(X=x_train, y=y_train, sample_weight=w_train,
                                     eval_set=[(x_valid, y_valid)], eval_sample_weight=[w_valid],
-                                    categorical_feature=self.cat_features_idx,
+                                    feature_name=list(self.features), categorical_feature=self.cat_features_idx,
                                     **self.training_params)
 
         self._make_feature_importance_df_()
         return None
 
-    @ApplyToDataDict(mode='efficient')
-    def _predict_(self, x: DataDict) -> DataDict:
-        assert self.model is not None, 'Fit model before or load from file.'
-        x_new = x.data[self.features]
+    def _fit_booster_(self, x: DataDict, y: DataDict) -> None:
+        import lightgbm as lgb
+        if self.target is None:
+            self.target = x['train'].target
+
+        if self.features is None:
+            self.features = x['train'].all_columns
+        features = list(self.features)
+
+        index = y['train'].data.dropna().index
+        columns = self.target + ([self.weight] if self.weight is not None else [])
+        x_train, x_valid = x['train'].reindex(index)[features], x['valid'][features]
+        y_train, y_valid = y['train'].reindex(index)[columns], y['valid'][columns]
+
+        if self.cat_features is not None:
+            self._set_cat_features_(features)
+        else:
+            self.cat_features_idx = 'auto'
+
+        params = self._model_params_()
+        params.pop('importance_type', None)
+        num_boost_round = params.pop('n_estimators')
+        params = {k: v for k, v in params.items() if v is not None}
+        params.update(metric=self.training_params.get('eval_metric'), verbose=-1)
+        dataset_params = DatasetCache.dataset_params(params)
+
+        def build(x_data, y_data, reference=None):
+            label = y_data.data[self.target[0]]
+            weight = y_data.data[self.weight] if self.weight is not None else None
+            return lgb.Dataset(x_data.feature_matrix(features), label=label, weight=weight, reference=reference,
+                               feature_name=features, categorical_feature=self.cat_features_idx,
+                               params=dataset_params, free_raw_data=True).construct()
+
+        fingerprints = [data.fingerprint() for data in (x_train, y_train, x_valid, y_valid)]
+        config = (features, self.cat_features_idx, sorted(dataset_params.items()))
+        train_key = DatasetCache.make_key(*fingerprints[:2], config)
+        train_set = self.dataset_cache.get(train_key, lambda: build(x_train, y_train))
+        # Valid Dataset is binned with bins of train Dataset.
+        valid_key = DatasetCache.make_key(train_key, *fingerprints[2:])
+        valid_set = self.dataset_cache.get(valid_key, lambda: build(x_valid, y_valid, train_set))
+
+        print('Training LightGBM')
+        print(f'X_train = {train_set.num_data(), train_set.num_feature()} X_valid = {valid_set.num_data()}')
+
+        callbacks = []
+        if self.training_params.get('early_stopping_rounds'):
+            callbacks.append(lgb.early_stopping(self.training_params['early_stopping_rounds'], verbose=False))
+        if self.training_params.get('verbose'):
+            callbacks.append(lgb.log_evaluation(self.training_params['verbose']))
+        self.model = lgb.train(params, train_set, num_boost_round=num_boost_round, valid_sets=[valid_set],
+                               valid_names=['valid'], callbacks=callbacks)
+        self._make_feature_importance_df_()
+        return None
+
+    def _predict_matrix_(self, x_new, params: dict) -> np.ndarray:
         if self.mode == 'Classifier':
-            prediction = self.model.predict_proba(x_new)
-            prediction = pd.DataFrame(prediction, index=x.index)
+            if hasattr(self.model, 'predict_proba'):
+                return self.model.predict_proba(x_new, **params)
+            # Loaded booster gives probability of positive class for binary problems.
+            prediction = self.model.predict(x_new, **params)
+            return np.column_stack([1 - prediction, prediction]) if prediction.ndim == 1 else prediction
         elif self.mode == 'Regressor':
-            prediction = self.model.predict(x_new)
-            prediction = pd.DataFrame(prediction, index=x.index, columns=[self.target])
+            return self.model.predict(x_new, **params)
         else:
             raise Exception('Unknown mode.')
+
+    @ApplyToDataDict(mode='efficient')
+    def _predict_(self, x: DataDict) -> DataDict:
+        assert self.model is not None, 'Fit model before or load from file.'
+        n_threads = self.predict_n_threads if self.predict_n_threads is not None else self.n_threads
+        params = {} if n_threads is None else {'num_threads': n_threads}
+        chunk_size = self.predict_chunk_size
+        if chunk_size is None or len(x) <= chunk_size:
+            prediction = self._predict_matrix_(x.feature_matrix(self.features), params)
+        else:
+            # Only features of one chunk are materialized, predictions are written into preallocated output.
+            x = x[list(self.features)]
+            prediction = None
+            for start in range(0, len(x), chunk_size):
+                stop = min(start + chunk_size, len(x))
+                chunk = self._predict_matrix_(x.take(slice(start, stop)).feature_matrix(self.features), params)
+                if prediction is None:
+                    prediction = np.empty((len(x), *chunk.shape[1:]), dtype=chunk.dtype)
+                prediction[start:stop] = chunk
+        columns = self.target if self.mode == 'Regressor' else None
+        prediction = pd.DataFrame(prediction, index=x.index, columns=columns)
         # TODO: сделать инвариантно к типу, например x.__class__.__init__(data=prediction, target=self.target)
-        y = TabularData(data=prediction, target=[self.target])
+        y = TabularData(data=prediction, target=self.target)
         return y
 
     def _set_cat_features_(self, features):
@@ -153,8 +387,8 @@ class LightGBM(Regressor):
         return df
 
     def _make_feature_importance_df_(self):
-        feature_importance = self.model.feature_importances_
-        feature_names = self.model.feature_name_
+        feature_importance = self.booster.feature_importance(importance_type=self.model_params['importance_type'])
+        feature_names = self.booster.feature_name()
 
         importance = {}
         for pair in sorted(zip(feature_importance, feature_names)):
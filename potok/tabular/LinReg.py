@@ -1,38 +1,170 @@
-import statsmodels.api as sm
+import hashlib
+import weakref
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
+from typing import Iterable
 # from typing import List, Iterator, Tuple
-from sklearn.linear_model import LinearRegression, Ridge, Lasso
-from sklearn.mixture import GaussianMixture
+from sklearn.linear_model import LinearRegression
 
 from ..core import Regressor, ApplyToDataDict, DataDict
 from .TabularData import TabularData
 
 
+class LinearStats:
+    """Sufficient statistics of weighted least squares, weighted sums over rows of 1, x, y, x xT and x yT,
+    where x and y are shifted by reference values, weighted means of the first dense chunk, so sums do not
+    lose precision when features are far from zero. Statistics of disjoint rows are added, statistics of
+    a subset of rows are subtracted, they are brought to reference values of the left operand."""
+    def __init__(self, n_features: int, n_targets: int, shift_x: np.ndarray = None, shift_y: np.ndarray = None):
+        self.sw = 0.0
+        self.sx = np.zeros(n_features)
+        self.sy = np.zeros(n_targets)
+        self.xx = np.zeros((n_features, n_features))
+        self.xy = np.zeros((n_features, n_targets))
+        self.shift_x = np.zeros(n_features) if shift_x is None else np.asarray(shift_x, dtype=np.float64)
+        self.shift_y = np.zeros(n_targets) if shift_y is None else np.asarray(shift_y, dtype=np.float64)
+        self.feature_names = None
+
+    def update(self, x, y: np.ndarray, w: np.ndarray = None) -> None:
+        import scipy.sparse as sp
+        y = np.asarray(y, dtype=np.float64)
+        w = np.ones(len(y)) if w is None else np.asarray(w, dtype=np.float64)
+        if hasattr(x, 'columns'):
+            self.feature_names = list(x.columns)
+        if sp.issparse(x):
+            if self.shift_x.any():
+                # Shift would make sparse features dense, chunk is accumulated unshifted and brought to shift.
+                part = LinearStats(len(self.sx), len(self.sy), shift_y=self.shift_y)
+                part.update(x, y, w)
+                self._accumulate_(part, 1.0)
+                return None
+            xw = sp.csr_matrix(x.multiply(w[:, None]))
+            self.xx += (x.T @ xw).toarray()
+            self.sx += np.asarray(xw.sum(axis=0)).ravel()
+        else:
+            x = np.asarray(x, dtype=np.float64)
+            if self.sw == 0 and w.sum() > 0:
+                self.shift_x = np.average(x, axis=0, weights=w)
+                self.shift_y = np.average(y, axis=0, weights=w)
+            xw = (x - self.shift_x) * w[:, None]
+            self.xx += (x - self.shift_x).T @ xw
+            self.sx += xw.sum(axis=0)
+        y = y - self.shift_y
+        self.xy += np.asarray(xw.T @ y)
+        self.sy += w @ y
+        self.sw += w.sum()
+        return None
+
+    def shifted(self, shift_x: np.ndarray, shift_y: np.ndarray) -> 'LinearStats':
+        """Same statistics with other reference values."""
+        d, e = self.shift_x - shift_x, self.shift_y - shift_y
+        new = LinearStats(len(self.sx), len(self.sy), shift_x, shift_y)
+        new.sw = self.sw
+        new.sx = self.sx + self.sw * d
+        new.sy = self.sy + self.sw * e
+        new.xx = self.xx + np.outer(self.sx, d) + np.outer(d, self.sx) + self.sw * np.outer(d, d)
+        new.xy = self.xy + np.outer(self.sx, e) + np.outer(d, self.sy) + self.sw * np.outer(d, e)
+        new.feature_names = self.feature_names
+        return new
+
+    def _accumulate_(self, other: 'LinearStats', sign: float) -> None:
+        other = other.shifted(self.shift_x, self.shift_y)
+        for name in ('sw', 'sx', 'sy', 'xx', 'xy'):
+            setattr(self, name, getattr(self, name) + sign * getattr(other, name))
+        return None
+
+    def _combine_(self, other: 'LinearStats', sign: float) -> 'LinearStats':
+        new = self.shifted(self.shift_x, self.shift_y)
+        new._accumulate_(other, sign)
+        return new
+
+    def __add__(self, other: 'LinearStats') -> 'LinearStats':
+        return self._combine_(other, 1.0)
+
+    def __sub__(self, other: 'LinearStats') -> 'LinearStats':
+        return self._combine_(other, -1.0)
+
+    def solve(self, alpha: float = 0.0):
+        """Coefficients with shape (targets, features) and intercepts, ridge penalty alpha is not applied to intercept.
+        Normal equations are solved for features and targets centered by their weighted means."""
+        assert self.sw > 0, 'No rows with known targets.'
+        xx = self.xx - np.outer(self.sx, self.sx) / self.sw
+        xy = self.xy - np.outer(self.sx, self.sy) / self.sw
+        coef = np.linalg.lstsq(xx + alpha * np.eye(len(self.sx)), xy, rcond=None)[0].T
+        intercept = self.shift_y + self.sy / self.sw - coef @ (self.shift_x + self.sx / self.sw)
+        return coef, intercept
+
+
+class StatsCache:
+    """LinearStats shared by copies of LinReg node, e.g. by folds and bags, stats of all rows are computed once.
+    Entries are keyed by identity of data and selected rows, contents are not pickled."""
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def __getstate__(self) -> dict:
+        return {'max_entries': self.max_entries, 'entries': OrderedDict()}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str, base, build) -> LinearStats:
+        # Base is referenced weakly, so id of a collected frame can not give stale stats.
+        entry = self.entries.get(key)
+        if entry is not None and entry[0]() is base:
+            self.entries.move_to_end(key)
+            return entry[1]
+        stats = build()
+        self.entries[key] = (weakref.ref(base), stats)
+        while self.max_entries is not None and len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return stats
+
+
 class LinReg(Regressor):
-    def __init__(self, 
+    fitted_attributes = ('model', 'index')
+
+    def __init__(self,
                  target=None,
                  features=None,
                  weight=None,
+                 solver='sklearn',
+                 alpha=None,
+                 chunk_size=None,
                  **kwargs,):
- 
+
         super().__init__(**kwargs)
         self.target = target
         self.features = features
         self.weight = weight
+        # With stats solver model is solved from X^T X and X^T y accumulated by row chunks, weights and ridge alpha
+        # are supported, folds of Validation reuse stats of all rows and subtract stats of valid rows.
+        assert solver in ('sklearn', 'stats'), f'Unknown solver = {solver}.'
+        assert solver == 'stats' or (alpha is None and chunk_size is None), 'alpha and chunk_size need stats solver.'
+        self.solver = solver
+        self.alpha = alpha if alpha is not None else 0.0
+        self.chunk_size = chunk_size if chunk_size is not None else 1000000
+        self.stats_cache = StatsCache() if solver == 'stats' else None
 
         self.model = None
         self.index = None
-    
+
     def _fit_(self, x: DataDict, y: DataDict) -> None:
         if self.target is None:
             self.target = x['train'].target
 
         if self.features is None:
-            self.features = x['train'].data.columns
-    
-        x_train = x['train'].data[self.features]
+            self.features = x['train'].all_columns
+
+        if self.solver == 'stats':
+            return self._fit_stats_(x, y)
+
         y_train = y['train'].data.dropna()[self.target]
-        x_train = x_train.reindex(y_train.index)
+        x_train = x['train'].reindex(y_train.index).feature_matrix(self.features)
 
         if self.weight is not None:
             w_train = y['train'].data.dropna()[self.weight]
@@ -47,14 +179,77 @@ class LinReg(Regressor):
         self.model = LinearRegression().fit(x_train, y_train,)
         return None
 
+    def _stats_(self, x: TabularData, y: TabularData) -> LinearStats:
+        """Stats of rows with known targets, rows are materialized chunk by chunk."""
+        if not x.index.equals(y.index):
+            x = x.reindex(y.index)
+        columns = self.target + ([self.weight] if self.weight is not None else [])
+        stats = LinearStats(len(self.features), len(self.target))
+        for start in range(0, len(y), self.chunk_size):
+            positions = np.arange(start, min(start + self.chunk_size, len(y)))
+            y_chunk = y.take(positions).data[columns]
+            known = y_chunk.notna().all(axis=1).to_numpy()
+            x_chunk = x.take(positions[known]).feature_matrix(self.features)
+            w_chunk = y_chunk[self.weight].to_numpy()[known] if self.weight is not None else None
+            stats.update(x_chunk, y_chunk[self.target].to_numpy(dtype=np.float64)[known], w_chunk)
+        return stats
+
+    def _fit_stats_(self, x: DataDict, y: DataDict) -> None:
+        x_train, y_train, x_valid, y_valid = x['train'], y['train'], x['valid'], y['valid']
+        datas = [x_train, y_train, x_valid, y_valid]
+        shared = all(isinstance(getattr(data, 'rows', None), np.ndarray) for data in datas)
+        if shared:
+            shared = x_train.base is x_valid.base and y_train.base is y_valid.base and \
+                np.array_equal(x_train.rows, y_train.rows) and np.array_equal(x_valid.rows, y_valid.rows)
+
+        if shared:
+            # Train and valid rows of a fold are all rows of Validation train, which are same for all folds.
+            rows = np.sort(np.concatenate([x_train.rows, x_valid.rows]))
+            config = repr((id(y_train.base), list(self.features), self.target, self.weight, self.chunk_size))
+            key = hashlib.sha1(rows.tobytes() + config.encode()).hexdigest()
+            total = self.stats_cache.get(key, x_train.base, lambda: self._stats_(x_train.copy(rows=rows),
+                                                                                 y_train.copy(rows=rows)))
+            key = hashlib.sha1(x_valid.rows.tobytes() + config.encode()).hexdigest()
+            valid = self.stats_cache.get(key, x_valid.base, lambda: self._stats_(x_valid, y_valid))
+            stats = total - valid
+        else:
+            stats = self._stats_(x_train, y_train)
+
+        print('Training Linear Model')
+        print(f'X_train = {(len(x_train), len(self.features))} shared stats = {shared}')
+        self.model = self._model_(stats)
+        return None
+
+    def _model_(self, stats: LinearStats) -> LinearRegression:
+        # Solution is kept in sklearn estimator, so prediction and InferencePlan do not depend on solver.
+        model = LinearRegression()
+        model.coef_, model.intercept_ = stats.solve(self.alpha)
+        model.n_features_in_ = model.coef_.shape[1]
+        if stats.feature_names is not None:
+            model.feature_names_in_ = np.asarray(stats.feature_names, dtype=object)
+        return model
+
+    def fit_chunks(self, chunks: Iterable[TabularData]) -> 'LinReg':
+        """Fits on chunks of train data with targets, e.g. of a file larger than memory, stats are accumulated by chunk."""
+        stats = None
+        for data in chunks:
+            if self.target is None:
+                self.target = data.target
+            if self.features is None:
+                self.features = [col for col in data.all_columns if col not in data.target and col != self.weight]
+            part = self._stats_(data, data)
+            stats = part if stats is None else stats + part
+        assert stats is not None, 'No chunks are given.'
+        self.model = self._model_(stats)
+        return self
+
     @ApplyToDataDict()
     def _predict_(self, x: DataDict) -> DataDict:
         assert self.model is not None, 'Fit model before or load from file.'
-        x_new = x.data[self.features]
+        x_new = x.feature_matrix(self.features)
         # prediction = self.model.predict(exog=X)
         prediction = self.model.predict(x_new)
         prediction = pd.DataFrame(prediction, index=x.index, columns=self.target)
         # TODO: сделать инвариантно к типу, например x.__class__.__init__(data=prediction, target=self.target)
         y = TabularData(data=prediction, target=self.target)
         return y
-
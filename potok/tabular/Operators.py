@@ -2,8 +2,6 @@ import numpy as np
 import pandas as pd
 from ..core import Operator, DataDict, ApplyToDataDict
 from typing import Tuple, Union
-from category_encoders.target_encoder import TargetEncoder
-from category_encoders.cat_boost import CatBoostEncoder
 
 
 class TransformY(Operator):
@@ -29,16 +27,12 @@ class TransformY(Operator):
 
     @ApplyToDataDict()
     def y_forward(self, y: DataDict, x: DataDict = None, x_frwd: DataDict = None) -> DataDict:
-        df = y.data
-        df[self.target] = self.forward(df[self.target])
-        y_frwd = y.copy(data=df)
+        y_frwd = y.assign({self.target: self.forward(y.data[self.target])})
         return y_frwd
 
     @ApplyToDataDict()
     def y_backward(self, y_frwd: DataDict) -> DataDict:
-        df = y_frwd.data
-        df[self.target] = self.backward(df[self.target])
-        y = y_frwd.copy(data=df)
+        y = y_frwd.assign({self.target: self.backward(y_frwd.data[self.target])})
         return y
 
 
@@ -166,6 +160,8 @@ class CreateFeatureSpace(Operator):
 
 
 class EncodeX(Operator):
+    fitted_attributes = ('categorizer',)
+
     def __init__(self, features_to_encode: list,
                  categorizer_name: str = None,
                  **kwargs):
@@ -183,6 +179,9 @@ class EncodeX(Operator):
         return x_frwd
 
     def _fit_(self, x: DataDict, y: DataDict) -> None:
+        from category_encoders.target_encoder import TargetEncoder
+        from category_encoders.cat_boost import CatBoostEncoder
+
         df_x = x['train'].data
         df_y = y['train'].data[y['train'].target]
         features = [f for f in self.features_to_encode if f in df_x.columns]
@@ -210,4 +209,18 @@ class EncodeX(Operator):
         #     try:
         #         self.categorizer = joblib.load(path + 'categorizer.trfrm')
         #     except:
-        #         pass
\ No newline at end of file
+        #         pass
+
+
+class CompactX(Operator):
+    """Compacts dtypes of features to cut memory, e.g. after CreateFeatureSpace, see TabularData.compact."""
+    def __init__(self, precision: str = 'float32', max_category_ratio: float = 0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.precision = precision
+        self.max_category_ratio = max_category_ratio
+
+    @ApplyToDataDict()
+    def x_forward(self, x: DataDict) -> DataDict:
+        x_frwd, saved = x.compact(self.precision, self.max_category_ratio)
+        print(f'Compacted {len(saved)} columns, saved {saved.sum() / 2 ** 20:.1f} MB')
+        return x_frwd
@@ -1,62 +1,373 @@
+import hashlib
 import pandas as pd
 import numpy as np
 from dataclasses import dataclass
-from typing import List
+from typing import List, Tuple, Union
 
 from ..core import Data
 
 
 @dataclass(init=False)
 class TabularData(Data):
-    data: pd.DataFrame
+    """Tabular data, it can be a view of base frame: positions of rows and columns are stored
+    and frame is materialized only when data is accessed, e.g. by a model.
+    Sparse features are kept aside of the frame as CSR matrix with rows aligned to the frame."""
+    base: pd.DataFrame
+    base_sparse = None
+    sparse_columns = ()
 
-    def __init__(self, 
+    def __init__(self,
                  data: pd.DataFrame,
-                 target: list = None, 
+                 target: list = None,
+                 sparse=None,
+                 sparse_columns: list = None,
                  ):
         assert isinstance(target, list) and isinstance(data, pd.DataFrame), 'Invalid input type.'
-        self.data = data
+        self.base = data
+        self.rows = None
+        self.columns = None
         self.target = target
+        # Index of view rows, it is cached since pandas index keeps hash table of labels for lookups.
+        self._index_ = None
+        if sparse is not None:
+            import scipy.sparse as sp
+            assert sparse.shape == (len(data), len(sparse_columns)), 'Sparse features and data shapes must be same.'
+            self.base_sparse = sp.csr_matrix(sparse)
+            self.sparse_columns = list(sparse_columns)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """Dense features frame, sparse features are in sparse attribute.
+        Rows and columns of a view are selected in one step, the view itself is not changed."""
+        if not self.is_view:
+            return self.base
+        if self.columns is None:
+            return self.base.iloc[self.rows]
+        columns = self._dense_positions_()
+        if self.rows is None:
+            return self.base.iloc[:, columns]
+        # pandas takes columns of all base rows before rows, the smaller intermediate frame is taken first.
+        if len(self.rows) * self.base.shape[1] <= len(self.base) * len(columns):
+            return self.base.iloc[self.rows].iloc[:, columns]
+        return self.base.iloc[:, columns].iloc[self.rows]
+
+    @data.setter
+    def data(self, df: pd.DataFrame) -> None:
+        self.base = df
+        self.rows, self.columns = None, None
+
+    @property
+    def sparse(self):
+        """Sparse features of selected rows and columns as CSR matrix or None."""
+        columns = self.selected_sparse_columns
+        if self.base_sparse is None or not columns:
+            return None
+        sparse = self.base_sparse[self.rows] if self.rows is not None else self.base_sparse
+        if self.columns is not None:
+            offsets = self.sparse_offsets
+            sparse = sparse[:, [offsets[col] for col in columns]]
+        return sparse
+
+    def _dense_positions_(self) -> np.ndarray:
+        offsets = self.sparse_offsets
+        return self.base.columns.get_indexer([col for col in self.columns if col not in offsets])
+
+    @property
+    def selected_sparse_columns(self) -> list:
+        if self.columns is None:
+            return list(self.sparse_columns)
+        offsets = self.sparse_offsets
+        return [col for col in self.columns if col in offsets]
+
+    @property
+    def sparse_offsets(self) -> dict:
+        return {col: i for i, col in enumerate(self.sparse_columns)}
+
+    @property
+    def is_view(self) -> bool:
+        return self.rows is not None or self.columns is not None
+
+    def __getstate__(self) -> dict:
+        # Views are materialized, so only selected rows are pickled.
+        data, sparse = self.data, self.sparse
+        state = super().__getstate__()
+        state.update(base=data, rows=None, columns=None, _index_=None,
+                     base_sparse=sparse, sparse_columns=self.selected_sparse_columns if sparse is not None else ())
+        return state
 
     def __getitem__(self, cols: List[str]) -> 'TabularData':
         assert isinstance(cols, list), 'Invalid key type.'
-        sub_df = self.data[cols]
-        new = self.copy(data=sub_df)
+        all_columns = set(self.all_columns)
+        missing = [col for col in cols if col not in all_columns]
+        if missing:
+            raise KeyError(f'Columns {missing} are not found.')
+        new = self.copy(columns=cols)
         return new
 
     def __len__(self) -> int:
-        return len(self.data)
+        return len(self.rows) if self.rows is not None else len(self.base)
+
+    def copy(self, **kwargs) -> 'TabularData':
+        # copy.copy would call __getstate__ and materialize the view.
+        if 'data' in kwargs and 'sparse' not in kwargs:
+            # Selected sparse features are kept if new frame has the same rows.
+            sparse = self.sparse
+            if sparse is not None and not kwargs['data'].index.equals(self.index):
+                raise Exception('Sparse features do not match rows of new data.')
+            kwargs.update(sparse=sparse, sparse_columns=self.selected_sparse_columns)
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        if 'data' in kwargs:
+            kwargs.update(base=kwargs.pop('data'), rows=None, columns=None)
+        if 'sparse' in kwargs:
+            kwargs['base_sparse'] = kwargs.pop('sparse')
+            if kwargs['base_sparse'] is None:
+                kwargs['sparse_columns'] = ()
+        if 'base' in kwargs or 'rows' in kwargs:
+            kwargs['_index_'] = None
+        new.__dict__.update(kwargs)
+        return new
+
+    def assign(self, columns: dict) -> 'TabularData':
+        """Copy with columns replaced or added, copy-on-write: frame of this data is never written,
+        only new columns are allocated and the rest are shared with this data."""
+        offsets = self.sparse_offsets
+        assert not any(col in offsets for col in columns), 'Sparse features can not be assigned.'
+        df = self.data
+        frame = {col: df[col] for col in df.columns}
+        frame.update(columns)
+        new = self.copy(data=pd.DataFrame(frame, index=df.index, copy=False))
+        return new
+
+    def take(self, positions: Union[np.ndarray, slice]) -> 'TabularData':
+        """View of rows at positions, the base frame is shared. Slice of rows of a frame slices the base without copy."""
+        if isinstance(positions, slice) and self.rows is None:
+            sparse = self.base_sparse[positions] if self.base_sparse is not None else None
+            return self.copy(base=self.base.iloc[positions], base_sparse=sparse)
+        rows = self.rows[positions] if self.rows is not None else np.asarray(positions)
+        new = self.copy(rows=rows)
+        return new
+
+    def feature_matrix(self, features: list) -> pd.DataFrame:
+        """Features as models input, block backed data returns NumPy array, sparse features give CSR matrix."""
+        offsets = self.sparse_offsets
+        if not any(f in offsets for f in features):
+            return self.data[features]
+
+        import scipy.sparse as sp
+        data = self[list(features)]
+        dense = [f for f in features if f not in offsets]
+        blocks = [sp.csr_matrix(data.data[dense].to_numpy(dtype=np.float64))] if dense else []
+        blocks.append(data.sparse)
+        matrix = sp.hstack(blocks, format='csr')
+        # Columns are reordered as in features.
+        order = dense + [f for f in features if f in offsets]
+        positions = {f: i for i, f in enumerate(order)}
+        return matrix[:, [positions[f] for f in features]]
+
+    @staticmethod
+    def _compact_column_(column: pd.Series, precision: str, max_category_ratio: float) -> pd.Series:
+        if pd.api.types.is_bool_dtype(column) or isinstance(column.dtype, pd.CategoricalDtype):
+            return column
+        if pd.api.types.is_integer_dtype(column):
+            return pd.to_numeric(column, downcast='integer')
+        if pd.api.types.is_float_dtype(column):
+            for dtype in {'exact': [np.float32], 'float32': [np.float32], 'float16': [np.float16, np.float32]}[precision]:
+                if column.dtype.itemsize <= np.dtype(dtype).itemsize:
+                    break
+                values = column.to_numpy()
+                with np.errstate(over='ignore'):
+                    compact = values.astype(dtype)
+                finite = np.isfinite(compact) | ~np.isfinite(values)
+                exact = precision != 'exact' or np.array_equal(compact.astype(values.dtype), values, equal_nan=True)
+                if finite.all() and exact:
+                    return pd.Series(compact, index=column.index, name=column.name)
+            return column
+        if pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+            if len(column) > 0 and column.nunique(dropna=True) <= max_category_ratio * len(column):
+                return column.astype('category')
+        return column
+
+    def compact(self, precision: str = 'float32', max_category_ratio: float = 0.5) -> Tuple['TabularData', pd.Series]:
+        """Downcasts numeric columns to the narrowest safe dtype, converts low cardinality strings to category.
+        Precision policy of floats: exact keeps only values exactly representable in float32,
+        float32 and float16 round values, float16 falls back to float32 when values overflow.
+        Target columns are kept. Returns compacted data and bytes saved per column."""
+        assert precision in ('exact', 'float32', 'float16'), f'Unknown precision = {precision}.'
+        df = self.data
+        columns = {}
+        for col in df.columns:
+            column = df[col]
+            if col not in self.target:
+                column = self._compact_column_(column, precision, max_category_ratio)
+            columns[col] = column
+        df_compact = pd.DataFrame(columns, index=df.index)
+        saved = df.memory_usage(index=False, deep=True) - df_compact.memory_usage(index=False, deep=True)
+        new = TabularData(df_compact, self.target, self.sparse, self.selected_sparse_columns)
+        return new, saved
+
+    def to_block(self, dtype=np.float64) -> 'TabularData':
+        from .BlockTabularData import BlockTabularData
+        return BlockTabularData.from_frame(self.data, self.target, dtype)
+
+    @property
+    def all_columns(self) -> list:
+        return list(self.columns) if self.columns is not None else list(self.base.columns) + list(self.sparse_columns)
 
     @property
     def X(self) -> 'TabularData':
-        columns = [col for col in self.data.columns if col not in self.target]
-        X = self.copy(data=self.data[columns])
+        columns = [col for col in self.all_columns if col not in self.target]
+        X = self.copy(columns=columns)
         return X
 
     @property
     def Y(self) -> 'TabularData':
-        columns = [col for col in self.data.columns if col in self.target]
-        y = self.copy(data=self.data[columns])
+        columns = [col for col in self.all_columns if col in self.target]
+        y = self.copy(columns=columns)
         return y
 
     @property
     def index(self):
-        return self.data.index
+        if self.rows is None:
+            return self.base.index
+        if self._index_ is None:
+            self._index_ = self.base.index[self.rows]
+        return self._index_
 
     def get_by_index(self, index) -> 'TabularData':
-        chunk = self.data.loc[self.data.index.isin(index)]
-        new = self.copy(data=chunk)
+        own_index = self.index
+        if own_index.is_unique:
+            positions = own_index.get_indexer(index)
+            positions = np.unique(positions[positions >= 0])
+        else:
+            positions = np.flatnonzero(own_index.isin(index))
+        new = self.take(positions)
         return new
 
     def reindex(self, index) -> 'TabularData':
-        df = self.data.reindex(index)
-        new = self.copy(data=df)
+        own_index = self.index
+        if not own_index.is_unique:
+            return self.copy(data=self.data.reindex(index))
+        positions = own_index.get_indexer(index)
+        if (positions >= 0).all():
+            return self.take(positions)
+        # Only requested rows are materialized, absent labels are filled with NaN.
+        taken = self.take(np.unique(positions[positions >= 0]))
+        df = taken.data.reindex(index)
+        if taken.sparse is None:
+            return self.copy(data=df)
+
+        import scipy.sparse as sp
+        # Absent rows of sparse features are empty.
+        sparse = sp.vstack([taken.sparse, sp.csr_matrix((1, len(taken.selected_sparse_columns)))], format='csr')
+        positions = taken.index.get_indexer(index)
+        sparse = sparse[np.where(positions >= 0, positions, len(taken))]
+        new = self.copy(data=df, sparse=sparse, sparse_columns=taken.selected_sparse_columns)
         return new
 
+    def fingerprint(self) -> str:
+        df = self.data
+        key = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+        key.update(repr((list(df.columns), list(df.dtypes), self.target)).encode())
+        sparse = self.sparse
+        if sparse is not None:
+            for array in (sparse.data, sparse.indices, sparse.indptr):
+                key.update(array.tobytes())
+            key.update(repr(self.selected_sparse_columns).encode())
+        return key.hexdigest()
+
+    def stats(self) -> dict:
+        usage = self.base.memory_usage(index=True, deep=False)
+        if self.columns is not None:
+            offsets = self.sparse_offsets
+            usage = usage[['Index', *[col for col in self.columns if col not in offsets]]]
+        size = int(usage.sum())
+        if self.base_sparse is not None:
+            sparse = self.base_sparse
+            size += sum(array.nbytes for array in (sparse.data, sparse.indices, sparse.indptr))
+        if self.rows is not None and len(self.base) > 0:
+            size = size * len(self.rows) // len(self.base)
+        return {'rows': len(self), 'bytes': size}
+
     @staticmethod
-    def combine(datas: List['TabularData']) -> 'TabularData':
+    def _align_(df: pd.DataFrame, index: pd.Index, columns: pd.Index) -> np.ndarray:
+        if not (df.index.equals(index) and df.columns.equals(columns)):
+            df = df.reindex(index=index, columns=columns)
+        return df.to_numpy(dtype=np.float64)
+
+    @staticmethod
+    def _weighted_median_(stack: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Weighted median skipping NaN, when cumulative weight is exactly half, midpoint of the two values
+        is taken, so equal weights give np.nanmedian."""
+        order = np.argsort(stack, axis=0)
+        values = np.take_along_axis(stack, order, axis=0)
+        cum_weights = np.cumsum(weights[order] * ~np.isnan(values), axis=0)
+        half = cum_weights[-1] / 2
+        tol = 1e-9 * cum_weights[-1]
+        lower = np.argmax(cum_weights >= half - tol, axis=0)
+        upper = np.argmax(cum_weights > half + tol, axis=0)
+        median = (np.take_along_axis(values, lower[None], axis=0)[0] +
+                  np.take_along_axis(values, upper[None], axis=0)[0]) / 2
+        median[cum_weights[-1] == 0] = np.nan
+        return median
+
+    @staticmethod
+    def combine(datas: List['TabularData'], method: str = 'mean', weights: list = None) -> 'TabularData':
+        """Reduces datas aligned by index and columns, NaN values are skipped.
+        Method is mean, median or rank (mean of percentile ranks), weights are weights of datas.
+        Mean and rank are accumulated input by input, median needs all inputs at once."""
+        assert method in ('mean', 'median', 'rank'), f'Unknown method = {method}.'
+        weights = np.ones(len(datas)) if weights is None else np.asarray(weights, dtype=np.float64)
+        assert len(weights) == len(datas), 'Number of weights and datas must be same.'
+
         dfs = [data.data for data in datas]
-        df_cmbn = pd.concat(dfs, axis=1, keys=range(len(dfs)))
-        df_cmbn = df_cmbn.groupby(level=[1], axis=1).mean()
-        new = datas[0].copy(data=df_cmbn)
+        index, columns = dfs[0].index, dfs[0].columns
+        for df in dfs[1:]:
+            if not df.index.equals(index):
+                index = index.union(df.index, sort=False)
+            if not df.columns.equals(columns):
+                columns = columns.union(df.columns, sort=False)
+        shape = len(index), len(columns)
+
+        if method == 'median':
+            stack = np.empty((len(dfs), *shape))
+            for i, df in enumerate(dfs):
+                stack[i] = TabularData._align_(df, index, columns)
+            result = TabularData._weighted_median_(stack, weights)
+        else:
+            total, total_weights = np.zeros(shape), np.zeros(shape)
+            for df, weight in zip(dfs, weights):
+                if method == 'rank':
+                    df = df.rank(pct=True)
+                values = TabularData._align_(df, index, columns)
+                mask = ~np.isnan(values)
+                total += weight * np.where(mask, values, 0.0)
+                total_weights += weight * mask
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = total / total_weights
+
+        df_cmbn = pd.DataFrame(result, index=index, columns=columns)
+        if all(data.sparse is None for data in datas):
+            return datas[0].copy(data=df_cmbn)
+        assert method == 'mean', 'Only mean of sparse features is supported.'
+        sparse = TabularData._combine_sparse_(datas, index, weights)
+        new = datas[0].copy(data=df_cmbn, sparse=sparse, sparse_columns=datas[0].selected_sparse_columns)
         return new
+
+    @staticmethod
+    def _combine_sparse_(datas: List['TabularData'], index: pd.Index, weights: np.ndarray):
+        import scipy.sparse as sp
+        assert all(data.selected_sparse_columns == datas[0].selected_sparse_columns for data in datas), \
+            'Sparse features must be same.'
+        total, total_weights = None, np.zeros(len(index))
+        for data, weight in zip(datas, weights):
+            # Rows of data are scattered into rows of union index.
+            positions = index.get_indexer(data.index)
+            scatter = sp.csr_matrix((np.full(len(positions), weight), (positions, np.arange(len(positions)))),
+                                    shape=(len(index), len(positions)))
+            part = scatter @ data.sparse
+            total = part if total is None else total + part
+            total_weights[positions] += weight
+        with np.errstate(divide='ignore'):
+            scale = np.where(total_weights > 0, 1 / total_weights, 0.0)
+        return sp.csr_matrix(sp.diags(scale) @ total)
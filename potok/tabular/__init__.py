@@ -1,11 +1,14 @@
 from .Folder import Folder, FolderByTime
 from .TabularData import TabularData
+from .BlockTabularData import BlockTabularData
+from .ArrowTabularData import ArrowTabularData
 from .LightGBM import LightGBM
 from .LinReg import LinReg
 from .DKL import Dkl
-from .Operators import TransformY, CreateFeatureSpace, EncodeX
+from .Operators import TransformY, CreateFeatureSpace, EncodeX, CompactX
 from .HyperOptimization import HrPrmOptRange, HrPrmOptChoise, HyperParamOptimization, DeepSearch
 from .Error import Error
-from .utils import SyntheticData
+from .InferencePlan import InferencePlan
+from .utils import SyntheticData, read_chunks
 
 
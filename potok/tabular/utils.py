@@ -1,22 +1,26 @@
-import scipy.stats as sst
 import numpy as np
 import pandas as pd
+from pathlib import Path
+from typing import Iterable, Iterator, List, Union
 
+from potok.core import DataDict
 from potok.tabular import TabularData
+from potok.tabular.ArrowTabularData import import_dataset
 
 
 class SyntheticData:
     def __init__(self,
                  problem='regression',
-                 pdf_train=sst.norm(loc=-1, scale=2),
-                 pdf_test=sst.norm(loc=1, scale=3),
+                 pdf_train=None,
+                 pdf_test=None,
                  seed=None):
+        import scipy.stats as sst
 
         assert problem in ['regression', 'classification']
         self.problem = problem
 
-        self.pdf_train = pdf_train
-        self.pdf_test = pdf_test
+        self.pdf_train = pdf_train if pdf_train is not None else sst.norm(loc=-1, scale=2)
+        self.pdf_test = pdf_test if pdf_test is not None else sst.norm(loc=1, scale=3)
         self.seed = seed
 
     def _create_sample_(self, pdf, size):
@@ -36,3 +40,57 @@ class SyntheticData:
     def create_test(self, size=10):
         data_test = self._create_sample_(self.pdf_test, size)
         return TabularData(data_test, target=['Target'])
+
+    def _create_features_(self, pdf, size, n_features, index):
+        x = pdf.rvs(size=(size, n_features), random_state=self.seed)
+        weights = np.linspace(2, 0.5, n_features)
+        y = x @ weights + 1
+        if self.problem == 'classification':
+            y = (y > np.mean(y)).astype(int)
+
+        df = pd.DataFrame(x, columns=[f'X_{i}' for i in range(n_features)], index=index)
+        df['Target'] = y
+        return df
+
+    def create_wide(self, size=10, n_features=100, train=True):
+        """Sample with many features X_0, X_1, ..., target is their linear combination."""
+        pdf = self.pdf_train if train else self.pdf_test
+        df = self._create_features_(pdf, size, n_features, pd.RangeIndex(size))
+        return TabularData(df, target=['Target'])
+
+    def create_panel(self, n_ids=10, n_dates=10, n_features=1, train=True):
+        """Panel sample with MultiIndex (id, date), dates are consecutive days for every id."""
+        pdf = self.pdf_train if train else self.pdf_test
+        dates = pd.date_range('2020-01-01', periods=n_dates, freq='D')
+        index = pd.MultiIndex.from_product([np.arange(n_ids), dates], names=['id', 'date'])
+        df = self._create_features_(pdf, len(index), n_features, index)
+        return TabularData(df, target=['Target'])
+
+
+def read_chunks(source: Union[str, Path, Iterable[pd.DataFrame]],
+                target: List[str],
+                chunk_size: int = 1000000,
+                unit: str = 'test',
+                key: str = 'data_1',
+                columns: List[str] = None,
+                index_col: Union[str, List[str]] = None) -> Iterator[DataDict]:
+    """Yields chunks of Parquet/CSV file or of DataFrames iterator as Pipeline.predict input,
+    chunks are units of key, as data of the fitted pipeline."""
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        if path.suffix == '.parquet' or path.is_dir():
+            ds = import_dataset()
+            dataset = ds.dataset(path, format='parquet')
+            frames = (batch.to_pandas() for batch in dataset.to_batches(columns=columns, batch_size=chunk_size))
+        elif path.suffix == '.csv':
+            frames = pd.read_csv(path, usecols=columns, index_col=index_col, chunksize=chunk_size)
+        else:
+            raise Exception(f'Unknown file format = {path.suffix}.')
+    else:
+        frames = source
+
+    for df in frames:
+        if index_col is not None and set(np.atleast_1d(index_col)).issubset(df.columns):
+            df = df.set_index(index_col)
+        x = TabularData(df, target=target).X
+        yield DataDict({key: DataDict(**{unit: x})})
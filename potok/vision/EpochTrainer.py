@@ -1,5 +1,4 @@
 from typing import List,  Tuple
-from torch.utils.tensorboard import SummaryWriter
 import torch.nn.functional as F
 import torch
 from time import gmtime, strftime
@@ -1,3 +1,4 @@
+import numpy as np
 from sklearn.model_selection import train_test_split
 
 from ..core import DataDict
@@ -15,9 +16,12 @@ class StratifiedImageFolder(Folder):
     def _fit_(self, x: DataDict, y: DataDict) -> None:
         assert x['train'] is not None, 'Train required.'
 
+        # Folds are positions of rows, as in Folder.
         index = x['train'].index
+        self.index_key = self._index_key_(index)
+        positions = np.arange(len(index), dtype=np.int32)
         strats = y['train'].Y.data
-        train_idx, valid_idx = train_test_split(index,
+        train_idx, valid_idx = train_test_split(positions,
                                                 test_size=self.split_ratio, 
                                                 random_state=self.seed, 
                                                 stratify=strats)
@@ -3,7 +3,6 @@ from typing import List, Any, Callable
 from pathlib import Path
 import pandas as pd
 import numpy as np
-import cv2
 import gc
 from tqdm import tqdm
 
@@ -55,6 +54,7 @@ class ImageClassificationData(Data):
     def __getitem__(self, index: int):
         chunk = self.df.iloc[index]
         if self.data is None:
+            import cv2
             img = cv2.imread(chunk['img_path'])
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         else:
@@ -74,6 +74,7 @@ class ImageClassificationData(Data):
         return prep_x
 
     def _load_(self) -> list:
+        import cv2
         imgs = []
         for path in tqdm(self.df['img_path'], desc='Loading imgs'): 
             img = cv2.imread(path)
@@ -100,25 +101,40 @@ class ImageClassificationData(Data):
     def index(self) -> np.ndarray:
         return self.df.index.to_numpy()
 
+    def _positions_(self, index: list) -> np.ndarray:
+        # Pandas index keeps hash table of labels built on the first lookup, a new frame builds a new one.
+        return self.df.index.get_indexer(index)
+
     def get_by_index(self, index: list) -> Data:
-        mask = self.df.index.isin(index)
+        if self.df.index.is_unique:
+            positions = self._positions_(index)
+            positions = np.unique(positions[positions >= 0])
+        else:
+            # get_indexer needs unique labels, every row of repeated labels is taken as with isin.
+            positions = np.flatnonzero(self.df.index.isin(index))
         batch = None
         if self.data is not None:
-            batch = self.data[mask]
-        chunk = self.df.loc[mask]
+            batch = np.take(self.data, positions, axis=0)
+        chunk = self.df.take(positions)
         new = self.copy(df=chunk, data=batch)
         return new
 
     def reindex(self, index: list) -> Data:
         data = None
         if self.data is not None:
-            idx = self.df.index 
-            permute = [np.argwhere(idx == i)[0, 0] for i in index]
-            data = self.data[permute]
+            positions = self._positions_(index)
+            assert (positions >= 0).all(), 'All index labels must be present.'
+            data = np.take(self.data, positions, axis=0)
         df = self.df.reindex(index)
         new = self.copy(df=df, data=data)
         return new
 
+    def stats(self) -> dict:
+        size = int(self.df.memory_usage(index=True, deep=False).sum())
+        if isinstance(self.data, np.ndarray):
+            size += self.data.nbytes
+        return {'rows': len(self.df), 'bytes': size}
+
     @staticmethod
     def combine(datas: List[Data]) -> Data:
         dfs = [data.df for data in datas]
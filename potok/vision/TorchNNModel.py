@@ -58,7 +58,12 @@ class NNModel(Regressor):
     # def _transform_backward_(self):
     #     pass
 
+    def _set_threads_(self) -> None:
+        if self.n_threads is not None:
+            torch.set_num_threads(self.n_threads)
+
     def _fit_(self, x: Data, y: Data) -> None:
+        self._set_threads_()
         self.model.train()
 
         x_frwd = self.transform_x(x)
@@ -77,6 +82,7 @@ class NNModel(Regressor):
         # return x, y_frwd
 
     def _predict_(self, x: Data) -> Data:
+        self._set_threads_()
         self.model.eval()
         x_frwd = self.transform_x(x)
         with torch.no_grad():
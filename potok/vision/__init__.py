@@ -1,9 +1,25 @@
-from .ImageData import ImageClassificationData
-from .Folder import StratifiedImageFolder
-from .utils import crop_face
-from .MobileNetV3 import mobilenet_v3_small
-from .BatchTrainer import BatchTrainer
-from .EpochTrainer import EpochTrainer
-from .Augmentation import AlbAugment
-from .Batcher import Batcher
-from .TorchNNModel import NNModel
\ No newline at end of file
+import importlib
+
+# Modules of vision import torch, torchvision and tqdm, so their names are imported on first access.
+_lazy_ = {
+    'ImageClassificationData': 'ImageData',
+    'StratifiedImageFolder': 'Folder',
+    'crop_face': 'utils',
+    'mobilenet_v3_small': 'MobileNetV3',
+    'BatchTrainer': 'BatchTrainer',
+    'EpochTrainer': 'EpochTrainer',
+    'AlbAugment': 'Augmentation',
+    'Batcher': 'Batcher',
+    'NNModel': 'TorchNNModel',
+}
+
+
+def __getattr__(name):
+    if name in _lazy_:
+        module = importlib.import_module('.' + _lazy_[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _lazy_.values():
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
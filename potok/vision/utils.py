@@ -1,8 +1,7 @@
-from autocrop import Cropper
-import cv2
-
-
 def crop_face(img, dim=256):
+    from autocrop import Cropper
+    import cv2
+
     # height, width, channels = img.shape
     # dim = min(height, width)
     
@@ -1,7 +1,20 @@
+import dill
+import gc
+import json
+import os
+import tempfile
+import threading
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 from typing import List, Iterator, Tuple
 
-from potok.core import DataDict, Pipeline
-from potok.tabular import Folder, LightGBM, TransformY, LinReg, SyntheticData
+from potok.core import DataDict, Pipeline, LayerCache, Tracer, ApplyToDataDict, Regressor
+from potok.core.ThreadBudget import ThreadBudget
+from potok.tabular import Folder, LightGBM, TransformY, LinReg, SyntheticData, read_chunks, InferencePlan
+from potok.tabular import TabularData, BlockTabularData, ArrowTabularData, CompactX
 from potok.methods import Validation, Bagging
 
 
@@ -60,8 +73,572 @@ def test_bagging() -> DataDict:
     return prediction
 
 
+def test_thread_backend() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    # Cube root keeps sign of target, so predictions transformed back are finite, unlike sqrt of negative ones.
+    cube_root = (np.cbrt, lambda y: y ** 3)
+    transform = TransformY(transform=cube_root, target='Target')
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(transform, validation, algo, shapes=[1, 1, 3], backend='thread', n_workers=3)
+    prediction = model.fit_predict(x, y)
+    transform = TransformY(transform=cube_root, target='Target')
+    validation = Validation(Folder(n_folds=3, seed=2424))
+    algo = LinReg(target=['Target'], features=['X'])
+    expected = Pipeline(transform, validation, algo, shapes=[1, 1, 3]).fit_predict(x, y)
+    for unit in ['train', 'test']:
+        assert np.isfinite(prediction['data_1'][unit].data.to_numpy()).all()
+        assert np.allclose(prediction['data_1'][unit].data, expected['data_1'][unit].data)
+    # Backend is set per context, pipelines in other threads do not change it.
+    seen = {}
+
+    def run(backend):
+        with ApplyToDataDict.use_backend(backend, n_workers=2):
+            barrier.wait()
+            seen[backend] = ApplyToDataDict.defaults.get()
+            barrier.wait()
+
+    barrier = threading.Barrier(2)
+    workers = [threading.Thread(target=run, args=(backend,)) for backend in ['thread', 'process']]
+    [worker.start() for worker in workers]
+    [worker.join() for worker in workers]
+    assert seen == {'thread': ('thread', 2, False), 'process': ('process', 2, False)}
+    assert ApplyToDataDict.defaults.get() == ('map', None, False)
+    return prediction
+
+
+def test_process_layer() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(Bagging(2), validation, algo, shapes=[1, 2, 6], layer_backend='process', layer_n_workers=2)
+    prediction = model.fit_predict(x, y)
+    validation = Validation(Folder(n_folds=3, seed=2424))
+    algo = LinReg(target=['Target'], features=['X'])
+    expected = Pipeline(Bagging(2), validation, algo, shapes=[1, 2, 6]).fit_predict(x, y)
+    for unit in ['train', 'test']:
+        assert np.allclose(prediction['data_1'][unit].data, expected['data_1'][unit].data)
+    # Fitted state of nodes is returned from workers.
+    assert all(node.model is not None for node in model.layers[2])
+    return prediction
+
+
+class ThreadsProbe(Regressor):
+    @ApplyToDataDict()
+    def _predict_(self, x: DataDict) -> int:
+        return self.n_threads
+
+
+def test_thread_budget() -> dict:
+    assert ThreadBudget(8).split(3) == [3, 3, 2]
+    assert ThreadBudget(2).split(4) == [1, 1, 1, 1]
+    assert ThreadBudget(4).assign(3, 2) == [2, 2, 2]
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    validation = Validation(Folder(n_folds=3, seed=2424))
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(validation, algo, shapes=[1, 3], layer_backend='thread', layer_n_workers=2, n_threads=4)
+    model.fit(x, y)
+    report = model.threads_report()
+    assert report['Layer_1'] == [2, 2, 2]
+    # Threads of node are split between its units running at the same time too.
+    probe = ThreadsProbe()
+    probe.set_threads(4)
+    units = DataDict(train=1, valid=2, test=3)
+    with ApplyToDataDict.use_backend('thread', n_workers=2):
+        threads = probe._predict_(units)
+    assert [threads[unit] for unit in ['train', 'valid', 'test']] == [2, 2, 2] and probe.n_threads == 4
+    # Without threads budget units split all cores.
+    probe = ThreadsProbe()
+    with ApplyToDataDict.use_backend('thread', n_workers=2):
+        threads = probe._predict_(units)
+    assert set(threads.values()) == {min(ThreadBudget().split(2))} and probe.n_threads is None
+    return report
+
+
+def test_layer_cache() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    # Execution settings, e.g. threads budget of nodes, are not a part of cache keys.
+    for settings in [{}, {'n_threads': 4}, {'n_threads': 4, 'layer_backend': 'thread'}]:
+        cache = LayerCache(tempfile.mkdtemp(), max_entries=10)
+        predictions = []
+        for _ in range(2):
+            folder = Folder(n_folds=3, seed=2424)
+            validation = Validation(folder)
+            algo = LinReg(target=['Target'], features=['X'])
+            model = Pipeline(validation, algo, shapes=[1, 3], cache=cache, **settings)
+            model.fit(x, y)
+            predictions.append(model.predict(x))
+            # Refit of the same pipeline, which folder holds fitted folds, loads both layers.
+            model.fit(x, y)
+            # Threads are set on copies of nested nodes, not on nodes of user.
+            assert 'n_threads' not in folder.__dict__
+        assert cache.hits == 6 and len(list(cache.path.glob('*' + cache.suffix))) == 2
+        predictions.append(model.predict(x))
+        assert predictions[0]['data_1']['test'].data.equals(predictions[1]['data_1']['test'].data)
+        assert predictions[0]['data_1']['test'].data.equals(predictions[2]['data_1']['test'].data)
+    return predictions[1]
+
+
+def test_predict_stream() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(validation, algo, shapes=[1, 3])
+    model.fit(x, y)
+    df = x['data_1']['test'].data
+    chunks = read_chunks([df.iloc[:5], df.iloc[5:]], target=['Target'])
+    predictions = [prediction for prediction in model.predict_stream(chunks)]
+    assert len(predictions) == 2
+    expected = model.predict(DataDict(data_1=DataDict(test=x['data_1']['test'])))['data_1']['test'].data
+    streamed = pd.concat([prediction['data_1']['test'].data for prediction in predictions])
+    assert streamed.index.equals(expected.index) and np.allclose(streamed, expected)
+    assert next(read_chunks([df], target=['Target'], key='data_2')).keys() == ['data_2']
+    return predictions[-1]
+
+
+def test_inference_plan() -> float:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    transform = TransformY(transform='square', target='Target')
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(transform, Bagging(2), validation, algo, shapes=[1, 1, 2, 6])
+    model.fit(x, y)
+    plan = InferencePlan(model)
+    assert plan.predict({'X': 0.5}).shape == (1, 1)
+    error = plan.verify(model, x)
+    return error
+
+
+def test_tuple_keys() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict({('data', 1): x})
+    y = DataDict({('data', 1): y})
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(validation, algo, shapes=[1, 3])
+    model.fit(x, y)
+    prediction = model.predict(x)
+    assert prediction.keys() == [('data', 1)]
+    return prediction
+
+
+def test_tracer() -> dict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    tracer = Tracer()
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(validation, algo, shapes=[1, 3], layer_backend='process', layer_n_workers=2, tracer=tracer)
+    model.fit_predict(x, y)
+    report = tracer.report()
+    assert report['LinReg.fit']['calls'] == 3
+    assert report['LinReg._predict_']['calls'] == 9
+    file_name = os.path.join(tempfile.mkdtemp(), 'trace.json')
+    tracer.export(file_name)
+    with open(file_name) as json_file:
+        assert len(json.load(json_file)['traceEvents']) == len(tracer.events)
+    # CPU of threads started inside span, e.g. by OpenMP or BLAS, is counted.
+    tracer = Tracer()
+    worker = threading.Thread(target=lambda: sum(i * i for i in range(3000000)))
+    with Tracer.use(tracer), Tracer.span('worker', 'test'):
+        worker.start()
+        worker.join()
+    assert tracer.events[0]['args']['cpu_ms'] > 0.5 * tracer.events[0]['dur'] / 1e3
+    # Pipelines running in other threads record spans into their own tracers.
+    tracers = [Tracer(), Tracer()]
+
+    def run(tracer):
+        algo = LinReg(target=['Target'], features=['X'])
+        Pipeline(Validation(Folder(n_folds=3, seed=2424)), algo, shapes=[1, 3], tracer=tracer).fit_predict(x, y)
+
+    run(tracers[0])
+    expected = len(tracers[0].events)
+    tracers[0].clear()
+    workers = [threading.Thread(target=run, args=(tracer,)) for tracer in tracers]
+    [worker.start() for worker in workers]
+    [worker.join() for worker in workers]
+    assert [len(tracer.events) for tracer in tracers] == [expected, expected]
+    assert Tracer.active.get() is None
+    return report
+
+
+def test_fold_views() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    validation = Validation(Folder(n_folds=3, seed=2424))
+    x2, y2 = validation.fit(x, y)
+    fold = x2['Fold_1']
+    assert fold['train'].base is x['train'].base and fold['train'].is_view
+    assert fold['valid'].index.equals(y2['Fold_1']['valid'].index)
+    assert fold['valid'].data.index.equals(x['train'].get_by_index(fold['valid'].index).data.index)
+    # Materialization selects rows of the fold only and leaves the view as is.
+    view = fold['train']
+    rows = view.rows.copy()
+    assert view.data.shape == (len(rows), len(view.all_columns))
+    assert view.base is x['train'].base and np.array_equal(view.rows, rows)
+    # Positions of folds are not applied to train with other rows or order.
+    shuffled = DataDict(train=x['train'].take(np.arange(len(x['train']))[::-1]), test=x['test'])
+    try:
+        validation.x_forward(shuffled)
+    except Exception as error:
+        assert 'folds were fitted on' in str(error)
+    else:
+        raise AssertionError('Folds must not be applied to other train rows.')
+    return x2
+
+
+def test_weighted_bagging() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    folder = Folder(n_folds=3, seed=2424, reduce='median')
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(Bagging(2, weights=[0.25, 0.75]), validation, algo, shapes=[1, 2, 6])
+    prediction = model.fit_predict(x, y)
+    assert prediction['data_1']['test'].data.notna().all().all()
+    datas = [TabularData(pd.DataFrame({'Target': values}), ['Target'])
+             for values in ([10.0, 1.0, 1.0], [20.0, 2.0, 2.0], [np.nan, 3.0, 3.0])]
+    mean = TabularData.combine(datas, 'mean', weights=[1, 3, 1]).data['Target'].to_numpy()
+    assert np.allclose(mean, [17.5, 2.0, 2.0])
+    # Median is midpoint when cumulative weight is exactly half, equal weights give np.nanmedian.
+    median = TabularData.combine(datas, 'median', weights=[1, 1, 1.0001]).data['Target'].to_numpy()
+    assert np.allclose(median, [15.0, 2.0, 2.0])
+    median = TabularData.combine(datas, 'median', weights=[1, 1, 2]).data['Target'].to_numpy()
+    assert np.allclose(median, [15.0, 2.5, 2.5])
+    median = TabularData.combine(datas, 'median', weights=[1, 3, 1]).data['Target'].to_numpy()
+    assert np.allclose(median, [20.0, 2.0, 2.0])
+    return prediction
+
+
+def test_block_data() -> DataDict:
+    gene = SyntheticData(seed=2424)
+    data = DataDict(train=gene.create_wide(100, 5).to_block(), test=gene.create_wide(20, 5, train=False).to_block())
+    x = DataDict(data_1=data.X)
+    y = DataDict(data_1=data.Y)
+    assert np.shares_memory(x['data_1']['train'].values, data['train'].base)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'])
+    model = Pipeline(validation, algo, shapes=[1, 3])
+    prediction = model.fit_predict(x, y)
+    assert prediction['data_1']['test'].data.notna().all().all()
+    # Non-unique index is reindexed by pandas.
+    df = data['test'].data.iloc[[0, 0, 1]]
+    block = BlockTabularData.from_frame(df, ['Target'])
+    assert np.array_equal(block.reindex(df.index).values, df.to_numpy())
+    return prediction
+
+
+def test_arrow_data() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    path = tempfile.mkdtemp()
+    units = {}
+    for unit in ('train', 'test'):
+        df = x[unit].data.join(y[unit].data)
+        df.index.name = 'id'
+        df.reset_index().to_parquet(os.path.join(path, unit + '.parquet'))
+        units[unit] = ArrowTabularData(os.path.join(path, unit + '.parquet'), target=['Target'], index_col='id')
+    data = DataDict(**units)
+    predictions = []
+    for x, y in ((x, y), (data.X, data.Y)):
+        folder = Folder(n_folds=3, seed=2424)
+        validation = Validation(folder)
+        algo = LinReg(target=['Target'], features=['X'])
+        model = Pipeline(validation, algo, shapes=[1, 3])
+        predictions.append(model.fit_predict(DataDict(data_1=x), DataDict(data_1=y)))
+    assert np.allclose(predictions[0]['data_1']['test'].data, predictions[1]['data_1']['test'].data)
+    # Non-unique index is reindexed by pandas.
+    df = units['test'].data.iloc[[0, 0, 1]]
+    df.reset_index().to_parquet(os.path.join(path, 'repeated.parquet'))
+    repeated = ArrowTabularData(os.path.join(path, 'repeated.parquet'), target=['Target'], index_col='id')
+    assert repeated.reindex(df.index).data.equals(df)
+    return predictions[1]
+
+
+def test_compact_x() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(CompactX(), validation, algo, shapes=[1, 1, 3])
+    prediction = model.fit_predict(x, y)
+    x2 = model.layers[0][0].predict_forward(x['data_1'])
+    assert x2['train'].data['X'].dtype == np.float32
+    return prediction
+
+
+def test_sparse_data() -> DataDict:
+    gene = SyntheticData(seed=2424)
+    datas = {}
+    for name, size in [('train', 100), ('test', 20)]:
+        data = gene.create_wide(size, 2, train=name == 'train')
+        codes = np.random.RandomState(2424).randint(0, 10, size)
+        one_hot = sp.csr_matrix((np.ones(size), (np.arange(size), codes)), shape=(size, 10))
+        datas[name] = TabularData(data.data, data.target, one_hot, [f'Code_{i}' for i in range(10)])
+    data = DataDict(**datas)
+    x = DataDict(data_1=data.X)
+    y = DataDict(data_1=data.Y)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LinReg(target=['Target'])
+    model = Pipeline(Bagging(2), validation, algo, shapes=[1, 2, 6])
+    prediction = model.fit_predict(x, y)
+    assert sp.issparse(x['data_1']['train'].feature_matrix(['X_0', 'Code_1']))
+    assert prediction['data_1']['test'].data.notna().all().all()
+    # Dense view of sparse backed data is reindexed with new labels, sparse features are dropped.
+    index = data['train'].index
+    target = data['train'].Y.reindex(index[:2].append(pd.Index([-1])))
+    assert target.data['Target'].isna().tolist() == [False, False, True] and target.base_sparse is None
+    return prediction
+
+
+def test_copy_on_write() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    target = y['data_1']['train'].data.copy()
+    transform = TransformY(transform='square', target='Target')
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(Bagging(2), transform, Validation(Folder(n_folds=3, seed=2424)), algo, shapes=[1, 2, 2, 6])
+    prediction = model.fit_predict(x, y)
+    assert y['data_1']['train'].data.equals(target)
+    # View is materialized once, assigned copy shares columns of materialized frame.
+    train = x['data_1']['train']
+    train = train.copy(data=train.data)
+    data = train.assign({'X2': 0.0})
+    assert np.shares_memory(data.data['X'].values, train.data['X'].values)
+    assert 'X2' not in train.data and 'X2' not in x['data_1']['train'].data
+    return prediction
+
+
+def test_lazy_units() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    tracer = Tracer()
+    validation = Validation(Folder(n_folds=3, seed=2424))
+    algo = LinReg(target=['Target'], features=['X'])
+    model = Pipeline(validation, algo, shapes=[1, 3], lazy=True)
+    prediction = model.fit_predict(x, y)
+    assert prediction['data_1'].evaluated() == []
+    with Tracer.use(tracer):
+        assert prediction['data_1']['train'].data.notna().all().all()
+    # Test units of folds are not computed until test is read.
+    assert tracer.report()['LinReg._predict_']['calls'] == 3
+    assert prediction['data_1'].evaluated() == ['train']
+    # Pending thunks keep the model node had when they were created.
+    algo = LinReg(target=['Target'], features=['X'])
+    algo.fit(x['data_1'], y['data_1'])
+    expected = algo._predict_(x['data_1'])
+    with ApplyToDataDict.use_backend(lazy=True):
+        pending = algo._predict_(x['data_1'])
+    y_train = y['data_1']['train']
+    algo.fit(x['data_1'], DataDict(train=y_train.copy(data=y_train.data * 2), test=y['data_1']['test']))
+    assert np.allclose(pending['test'].data, expected['test'].data)
+    return prediction
+
+
+def test_lightgbm_dataset_cache() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    folder = Folder(n_folds=5, seed=2424)
+    validation = Validation(folder)
+    algo = LightGBM(target=['Target'], features=['X'], cache_dataset=True)
+    model = Pipeline(Bagging(2), validation, algo, shapes=[1, 2, 10])
+    prediction = model.fit_predict(x, y)
+    # Bags share binned train and valid Datasets of every fold, the second bag builds none.
+    cache = model.layers[2][0].dataset_cache
+    assert cache.builds == 10 and cache.hits == 10
+    assert prediction['data_1']['test'].data.notna().all().all()
+    return prediction
+
+
+def test_lightgbm_save_load() -> DataDict:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LightGBM(target=['Target'], features=['X'])
+    model = Pipeline(validation, algo, shapes=[1, 3])
+    model.fit(x, y)
+    expected = model.predict(x)
+    with tempfile.TemporaryDirectory() as tmp:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', dill.PicklingWarning)
+            model.save(Path(tmp))
+        path = next(Path(tmp).iterdir())
+        prefix = str(path.resolve())
+        assert (path / 'Layer_1' / 'LightGBM_0' / LightGBM.manifest_name).exists()
+        loaded = Pipeline(Validation(Folder(n_folds=3, seed=2424)), LightGBM(target=['Target'], features=['X']),
+                          shapes=[1, 3])
+        loaded.load(path)
+        prediction = loaded.predict(x)
+        # Loaded boosters are shared by nodes and freed with the last of them.
+        again = Pipeline(Validation(Folder(n_folds=3, seed=2424)), LightGBM(target=['Target'], features=['X']),
+                         shapes=[1, 3])
+        again.load(path)
+        assert again.layers[1][0].model is loaded.layers[1][0].model
+        del again
+        manifest_name = path / 'Layer_1' / 'LightGBM_0' / LightGBM.manifest_name
+        manifest = json.loads(manifest_name.read_text())
+        manifest_name.write_text(json.dumps({**manifest, 'features': ['Y']}))
+        try:
+            LightGBM(target=['Target'], features=['X']).load(path / 'Layer_1' / 'LightGBM_0')
+        except AssertionError as error:
+            assert 'features' in str(error)
+        else:
+            raise AssertionError('Model with other features must not be loaded.')
+    # Predict-only models are boosters without sklearn estimator.
+    assert not hasattr(loaded.layers[1][0].model, 'predict_proba')
+    assert np.allclose(prediction['data_1']['test'].data, expected['data_1']['test'].data)
+    assert len([key for key in LightGBM.boosters.keys() if key[0].startswith(prefix)]) == 3
+    del loaded
+    gc.collect()
+    assert not [key for key in LightGBM.boosters.keys() if key[0].startswith(prefix)]
+    return prediction
+
+
+def test_merged_boosters() -> float:
+    x, y = generate_regression_data(problem='regression')
+    x = DataDict(data_1=x)
+    y = DataDict(data_1=y)
+    transform = TransformY(transform='square', target='Target')
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LightGBM(target=['Target'], features=['X'])
+    model = Pipeline(transform, Bagging(2), validation, algo, shapes=[1, 1, 2, 6])
+    model.fit(x, y)
+    plan = InferencePlan(model, merge=True)
+    assert len(plan.boosters) == 1
+    error = plan.verify(model, x)
+    import lightgbm as lgb
+    features = np.random.RandomState(0).rand(100, 2)
+    dataset = lgb.Dataset(features, features[:, 0], feature_name=['A', 'B'])
+    booster = lgb.train({'objective': 'regression', 'verbose': -1}, dataset, 3)
+    other = lgb.train({'objective': 'regression', 'verbose': -1},
+                      lgb.Dataset(features, features[:, 0], feature_name=['A', 'C']), 3)
+    sqrt_booster = lgb.train({'objective': 'regression', 'reg_sqrt': True, 'verbose': -1}, dataset, 3)
+    for boosters in ([booster, other], [booster, sqrt_booster]):
+        try:
+            LightGBM.merge_boosters(boosters)
+        except Exception:
+            continue
+        raise AssertionError('Boosters must not be merged.')
+    return error
+
+
+def test_chunked_predict() -> DataDict:
+    gene = SyntheticData(seed=2424)
+    data = DataDict(train=gene.create_wide(100, 3), test=gene.create_wide(50, 3, train=False))
+    x = DataDict(data_1=data.X)
+    y = DataDict(data_1=data.Y)
+    folder = Folder(n_folds=3, seed=2424)
+    validation = Validation(folder)
+    algo = LightGBM(target=['Target'])
+    model = Pipeline(validation, algo, shapes=[1, 3])
+    model.fit(x, y)
+    expected = model.predict(x)
+    shapes = []
+    for node in model.layers[1]:
+        node.predict_chunk_size = 7
+        node.predict_n_threads = 1
+        predict_matrix = node._predict_matrix_
+        node._predict_matrix_ = lambda x_new, params, f=predict_matrix: shapes.append(x_new.shape) or f(x_new, params)
+    prediction = model.predict(x)
+    assert np.allclose(prediction['data_1']['test'].data, expected['data_1']['test'].data)
+    # Every chunk materializes at most chunk size rows of features only.
+    assert shapes and all(shape[0] <= 7 and shape[1] == 3 for shape in shapes)
+    return prediction
+
+
+def test_linreg_stats() -> DataDict:
+    gene = SyntheticData(seed=2424)
+    data = DataDict(train=gene.create_wide(200, 4), test=gene.create_wide(50, 4, train=False))
+    x = DataDict(data_1=data.X)
+    y = DataDict(data_1=data.Y)
+    predictions = []
+    for params in [{}, {'solver': 'stats', 'chunk_size': 30}]:
+        folder = Folder(n_folds=3, seed=2424)
+        validation = Validation(folder)
+        algo = LinReg(target=['Target'], **params)
+        model = Pipeline(validation, algo, shapes=[1, 3])
+        predictions.append(model.fit_predict(x, y))
+    # Stats of all rows are computed once and shared by folds.
+    assert len(algo.stats_cache) == 4
+    for unit in ['train', 'test']:
+        assert np.allclose(predictions[0]['data_1'][unit].data, predictions[1]['data_1'][unit].data)
+    df = data['train'].data
+    chunks = (TabularData(df.iloc[i:i + 50], ['Target']) for i in range(0, len(df), 50))
+    algo = LinReg(target=['Target'], solver='stats').fit_chunks(chunks)
+    reference = LinReg(target=['Target'])
+    reference.fit(DataDict(train=data.X['train']), DataDict(train=data.Y['train']))
+    assert np.allclose(algo.model.coef_, reference.model.coef_)
+    # Weights and ridge penalty on features far from zero, where unshifted normal equations lose precision.
+    from sklearn.linear_model import Ridge
+    rng = np.random.RandomState(2424)
+    features = rng.normal(size=(300, 3)) + 1e5
+    df = pd.DataFrame(features, columns=['A', 'B', 'C'])
+    df['Target'] = features @ np.array([1.0, -2.0, 0.5]) + rng.normal(size=300)
+    df['W'] = rng.rand(300)
+    for alpha in [0.0, 5.0]:
+        chunks = (TabularData(df.iloc[i:i + 70], ['Target']) for i in range(0, len(df), 70))
+        algo = LinReg(target=['Target'], weight='W', solver='stats', alpha=alpha).fit_chunks(chunks)
+        ridge = Ridge(alpha=alpha).fit(features, df[['Target']], sample_weight=df['W'])
+        assert np.allclose(algo.model.coef_, ridge.coef_, rtol=1e-8, atol=1e-10)
+        assert np.allclose(algo.model.intercept_, ridge.intercept_, rtol=1e-8)
+    try:
+        LinReg(target=['Target'], alpha=1.0)
+    except AssertionError:
+        return predictions[1]
+    raise AssertionError('alpha needs stats solver.')
+
+
 if __name__ == "__main__":
     pred1 = test_lightgbm_regression()
     pred2 = test_lightgbm_classification()
     pred3 = test_linear_regression()
     pred4 = test_bagging()
+    pred5 = test_thread_backend()
+    pred6 = test_process_layer()
+    report = test_thread_budget()
+    pred7 = test_layer_cache()
+    pred8 = test_predict_stream()
+    error = test_inference_plan()
+    pred9 = test_tuple_keys()
+    report = test_tracer()
+    x2 = test_fold_views()
+    pred10 = test_weighted_bagging()
+    pred11 = test_block_data()
+    pred12 = test_arrow_data()
+    pred13 = test_compact_x()
+    pred14 = test_sparse_data()
+    pred15 = test_copy_on_write()
+    pred16 = test_lazy_units()
+    pred17 = test_lightgbm_dataset_cache()
+    pred18 = test_lightgbm_save_load()
+    error = test_merged_boosters()
+    pred19 = test_chunked_predict()
+    pred20 = test_linreg_stats()
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY_MODULES = {'ray', 'tensorflow', 'tensorflow_probability', 'ax', 'statsmodels', 'lightgbm',
+                 'category_encoders', 'torch', 'cv2', 'autocrop', 'scipy'}
+
+
+def imported_modules(statement: str) -> set:
+    code = f'import sys; {statement}; print(" ".join(sys.modules))'
+    root = Path(__file__).parents[1]
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    return set(out.stdout.split())
+
+
+def test_core_import():
+    modules = imported_modules('import potok.core')
+    assert not modules & (HEAVY_MODULES | {'pandas', 'sklearn'})
+
+
+def test_tabular_import():
+    modules = imported_modules('from potok.tabular import LinReg, LightGBM, TabularData')
+    assert not modules & (HEAVY_MODULES - {'scipy'})
+
+
+def test_vision_import():
+    modules = imported_modules('import potok.vision; from potok.vision import crop_face')
+    assert not modules & (HEAVY_MODULES | {'torchvision', 'tqdm', 'pandas', 'sklearn'})